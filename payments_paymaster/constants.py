@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 INVOICE_REJECTED = -8
 
 ERROR_CODES = {
@@ -25,3 +27,27 @@ ERROR_CODES = {
     -24: 'Платежная система временно отключена',
     -25: 'Ошибка при авторизации 3Dsec',
 }
+
+WAITING_MODE_POLL = 'poll'
+WAITING_MODE_REFRESH = 'refresh'
+WAITING_MODES = (WAITING_MODE_POLL, WAITING_MODE_REFRESH)
+
+API_VERIFY_SYNC = 'sync'
+API_VERIFY_DEFERRED = 'deferred'
+API_VERIFY_MODES = (API_VERIFY_SYNC, API_VERIFY_DEFERRED)
+
+NOTIFICATION_STORAGE_PAYMENT = 'payment'
+NOTIFICATION_STORAGE_MODEL = 'model'
+NOTIFICATION_STORAGES = (NOTIFICATION_STORAGE_PAYMENT, NOTIFICATION_STORAGE_MODEL)
+
+PaymentState = namedtuple('PaymentState', [
+    'INITIATED',
+    'PROCESSING',
+    'COMPLETE',
+    'CANCELLED',
+])(
+    'INITIATED',
+    'PROCESSING',
+    'COMPLETE',
+    'CANCELLED',
+)
@@ -0,0 +1,106 @@
+import time
+from collections import Counter
+
+from .utils import imap_unordered
+
+
+def percentile(values, percent):
+    """ Перцентиль по методу ближайшего ранга, values должны быть отсортированы """
+    if not values:
+        return 0
+    index = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+class LoadReport(object):
+    def __init__(self):
+        self.latencies = []
+        self.results = Counter()
+        self.elapsed = 0
+
+    @property
+    def count(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        return self.count / self.elapsed if self.elapsed else 0
+
+    def add(self, latency, result):
+        self.latencies.append(latency)
+        self.results[result] += 1
+
+    def format(self):
+        latencies = sorted(self.latencies)
+        lines = [
+            'requests: {0}, elapsed: {1:.2f}s, throughput: {2:.1f} req/s'.format(
+                self.count, self.elapsed, self.throughput),
+            'latency ms: p50 {0:.1f}, p90 {1:.1f}, p99 {2:.1f}, max {3:.1f}'.format(
+                *[percentile(latencies, p) * 1000 for p in (50, 90, 99, 100)]),
+        ]
+        lines.extend('  {0}: {1}'.format(result, count)
+                     for result, count in self.results.most_common())
+        return '\n'.join(lines)
+
+
+def run_load(func, items, concurrency, classify=None, errors=(Exception,)):
+    """
+    Выполнить func для каждого элемента items в concurrency потоков
+    :param classify: функция (результат или исключение) -> метка для отчета
+    :param errors: исключения, которые считаются в отчете, остальные прерывают нагрузку
+    :return: LoadReport
+    """
+    classify = classify or (lambda result: type(result).__name__)
+
+    def timed(item):
+        started = time.perf_counter()
+        try:
+            result = func(item)
+        except errors as e:
+            result = e
+        return time.perf_counter() - started, result
+
+    report = LoadReport()
+    started = time.perf_counter()
+    for _, future in imap_unordered(timed, items, concurrency):
+        latency, result = future.result()
+        report.add(latency, classify(result))
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def notification_payload(provider, payment, sys_payment_id, **extra):
+    """ Подписанное уведомление об оплате, как его отправляет paymaster """
+    data = {
+        'LMI_MERCHANT_ID': provider.client_id,
+        'LMI_PAYMENT_NO': provider.get_payment_number(payment),
+        'LMI_SYS_PAYMENT_ID': str(sys_payment_id),
+        'LMI_SYS_PAYMENT_DATE': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'LMI_PAYMENT_AMOUNT': str(payment.total),
+        'LMI_CURRENCY': payment.currency,
+        'LMI_PAID_AMOUNT': str(payment.total),
+        'LMI_PAID_CURRENCY': payment.currency,
+        'LMI_PAYMENT_SYSTEM': '3',
+        'LMI_SIM_MODE': '0',
+        'PAYMENT_TOKEN': payment.token,
+    }
+    data.update(extra)
+    data = _drop_empty(data)
+    data['LMI_HASH'] = provider.signer.sign(data)
+    return data
+
+
+def prerequest_payload(provider, payment):
+    return _drop_empty({
+        'LMI_PREREQUEST': '1',
+        'LMI_MERCHANT_ID': provider.client_id,
+        'LMI_PAYMENT_NO': provider.get_payment_number(payment),
+        'LMI_PAYMENT_AMOUNT': str(payment.total),
+        'LMI_CURRENCY': payment.currency,
+        'PAYMENT_TOKEN': payment.token,
+    })
+
+
+def _drop_empty(data):
+    """ Поля со значением None не отправляются, как пустые поля формы """
+    return {key: value for key, value in data.items() if value is not None}
@@ -0,0 +1,80 @@
+import contextlib
+import datetime
+
+from django.core.management import BaseCommand
+
+from ...loadtest import run_load
+from ...rest_api.client import PaymasterApiClient, get_session
+from ...rest_api.fake_server import FakePaymasterServer, serve
+from ...rest_api.retry import RetryPolicy
+from ...rest_api.throttling import Throttle
+
+
+class Command(BaseCommand):
+    help = 'Load test of PaymasterApiClient against the local fake server or given endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', help='API endpoint, by default local fake server')
+        parser.add_argument('--login', default='login')
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--method', default='get_payment',
+                            choices=['get_payment', 'get_payment_by_invoice_id', 'get_payments'])
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--payments', type=int, default=1000,
+                            help='payments in fake server')
+        parser.add_argument('--latency', type=float, default=0,
+                            help='fake server latency, seconds')
+        parser.add_argument('--error-rate', type=float, default=0,
+                            help='fake server error rate, 0..1')
+        parser.add_argument('--rate-limit', type=float,
+                            help='client side limit, requests per second')
+        parser.add_argument('--max-concurrency', type=int,
+                            help='client side adaptive concurrency limit')
+        parser.add_argument('--retries', type=int, default=0,
+                            help='retries of transient failures')
+
+    def handle(self, *args, **options):
+        throttle = None
+        if options['rate_limit'] or options['max_concurrency']:
+            throttle = Throttle(options['rate_limit'], max_concurrency=options['max_concurrency'])
+        with self._endpoint(options) as endpoint:
+            client = PaymasterApiClient(
+                options['login'], options['password'], endpoint=endpoint,
+                session=get_session(pool_size=options['concurrency']), throttle=throttle,
+                retry=RetryPolicy(options['retries']) if options['retries'] else None,
+            )
+            call = self._get_call(client, options)
+            report = run_load(call, range(options['requests']), options['concurrency'])
+        self.stdout.write('{0} x{1} at {2}'.format(
+            options['method'], options['concurrency'], endpoint))
+        self.stdout.write(report.format())
+        if throttle is not None:
+            stats = throttle.stats
+            self.stdout.write(
+                'throttle: queued {queued_requests}/{requests}, queued time {queued_time:.3f}s, '
+                'max {max_queued_time:.3f}s, overloads {overloads}, '
+                'concurrency limit {concurrency_limit}'.format(**stats))
+
+    @contextlib.contextmanager
+    def _endpoint(self, options):
+        if options['endpoint']:
+            yield options['endpoint']
+            return
+        server = FakePaymasterServer(options['login'], options['password'],
+                                     latency=options['latency'],
+                                     error_rate=options['error_rate'])
+        server.populate(options['payments'])
+        with serve(server) as endpoint:
+            yield endpoint
+
+    def _get_call(self, client, options):
+        count = options['payments']
+        if options['method'] == 'get_payment_by_invoice_id':
+            return lambda i: client.get_payment_by_invoice_id(
+                'invoice-{0}'.format(i % count + 1), 'merchant')
+        if options['method'] == 'get_payments':
+            today = datetime.date.today()
+            return lambda i: client.get_payments(
+                period_from=today - datetime.timedelta(days=i % 30 + 1), period_to=today)
+        return lambda i: client.get_payment(i % count + 1)
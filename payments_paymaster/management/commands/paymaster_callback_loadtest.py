@@ -0,0 +1,125 @@
+import random
+import threading
+
+from django.core.management import BaseCommand
+from payments import get_payment_model
+from payments.core import provider_factory
+
+from ...loadtest import notification_payload, prerequest_payload, run_load
+
+
+class Command(BaseCommand):
+    help = ('Simulate paymaster prerequest, notification and browser return '
+            'for many payments and report callback throughput and latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variant', default='paymaster')
+        parser.add_argument('--url', help='base url of running instance, '
+                                          'by default requests go through django test client')
+        parser.add_argument('--payments', type=int, default=100)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--duplicates', type=int, default=1,
+                            help='notifications per payment, extra ones simulate retries')
+        parser.add_argument('--bad-hash-rate', type=float, default=0,
+                            help='share of notifications with broken signature, 0..1')
+        parser.add_argument('--amount', default='100.00')
+        parser.add_argument('--keep', action='store_true', help='do not delete created payments')
+
+    def handle(self, *args, **options):
+        provider = provider_factory(options['variant'])
+        post, get, errors = self._get_transport(options['url'])
+
+        payments = [
+            get_payment_model().objects.create(
+                variant=options['variant'], total=options['amount'], currency='RUB')
+            for _ in range(options['payments'])
+        ]
+        try:
+            self._run(provider, payments, post, get, errors, options)
+        finally:
+            if not options['keep']:
+                get_payment_model().objects.filter(pk__in=[p.pk for p in payments]).delete()
+
+    def _run(self, provider, payments, post, get, errors, options):
+        concurrency = options['concurrency']
+
+        def prerequest(payment):
+            return post(payment.get_process_url(), prerequest_payload(provider, payment))
+
+        # retries go after the first attempts, shuffled within each round
+        notifications = []
+        for attempt in range(options['duplicates']):
+            attempts = []
+            for n, payment in enumerate(payments):
+                data = notification_payload(provider, payment, sys_payment_id=n + 1)
+                if random.random() < options['bad_hash_rate']:
+                    data['LMI_HASH'] = 'broken'
+                attempts.append((payment, data, attempt > 0))
+            random.shuffle(attempts)
+            notifications.extend(attempts)
+
+        def notification(item):
+            payment, data, duplicate = item
+            return post(payment.get_process_url(), data), duplicate
+
+        def browser_return(payment):
+            return get(payment.get_process_url())
+
+        self._report('prerequest', run_load(
+            prerequest, payments, concurrency, self._classify, errors))
+        self._report('notification', run_load(
+            notification, notifications, concurrency, self._classify_notification,
+            errors))
+        self._report('return', run_load(
+            browser_return, payments, concurrency, self._classify, errors))
+
+    def _report(self, stage, report):
+        self.stdout.write('{0}:'.format(stage))
+        self.stdout.write(report.format())
+
+    def _classify(self, response):
+        if isinstance(response, Exception):
+            return type(response).__name__
+        if response.status_code in (301, 302):
+            return 'redirect'
+        if response.content == b'HashError':
+            return 'HashError'
+        return str(response.status_code)
+
+    def _classify_notification(self, result):
+        if isinstance(result, Exception):
+            return type(result).__name__
+        response, duplicate = result
+        label = self._classify(response)
+        if duplicate and label != 'HashError':
+            return 'duplicate {0}'.format(label)
+        return label
+
+    def _get_transport(self, url):
+        """
+        Функции post и get и исключения, которые считаются ответом под нагрузкой:
+        сетевые ошибки для --url, для test client любое исключение - ошибка в коде
+        """
+        if url:
+            import requests
+            session = requests.Session()
+            return (
+                lambda path, data: session.post(url.rstrip('/') + path, data=data,
+                                                allow_redirects=False),
+                lambda path: session.get(url.rstrip('/') + path, allow_redirects=False),
+                (requests.RequestException,),
+            )
+
+        from django.test import Client
+        local = threading.local()
+
+        def client():
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            return local.client
+
+        return (
+            lambda path, data: client().post(path, data),
+            lambda path: client().get(path),
+            (),
+        )
@@ -0,0 +1,103 @@
+import datetime
+from decimal import Decimal
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from payments import PaymentStatus, get_payment_model
+from payments.core import provider_factory
+from payments.signals import status_changed
+
+
+def _is_preferred(candidate, current):
+    """
+    Выбор между попытками оплаты одного счета: оплаченная важнее отмененной,
+    при одинаковом статусе - изменившаяся позже
+    """
+    if candidate[0] != current[0]:
+        return candidate[0] == PaymentStatus.CONFIRMED
+    if candidate[3] is None or current[3] is None:
+        return current[3] is None
+    return candidate[3] > current[3]
+
+
+class Command(BaseCommand):
+    help = ('Sync WAITING payments with their final state in Paymaster '
+            'using listPaymentsFilter for the given period')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variant', default='paymaster')
+        parser.add_argument('--from', dest='period_from',
+                            help='period start, YYYY-MM-DD, by default --days ago')
+        parser.add_argument('--to', dest='period_to',
+                            help='period end, YYYY-MM-DD, by default tomorrow UTC')
+        parser.add_argument('--days', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='local payments matched and updated per transaction')
+        parser.add_argument('--chunk-days', type=int, help='split period into windows of days')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='concurrent listPaymentsFilter requests')
+        parser.add_argument('--dry-run', action='store_true', help='report changes only')
+
+    def handle(self, *args, **options):
+        provider = provider_factory(options['variant'])
+        period_from = options['period_from'] or (
+            datetime.datetime.utcnow().date() - datetime.timedelta(days=options['days']))
+
+        remote_payments = provider.api_client.iter_payments(
+            period_from, options['period_to'], merchant_id=provider.client_id,
+            chunk_days=options['chunk_days'], max_concurrency=options['concurrency'])
+
+        stats = {'fetched': 0, 'matched': 0, PaymentStatus.CONFIRMED: 0,
+                 PaymentStatus.REJECTED: 0}
+        # у счета может быть несколько попыток оплаты, выбор делается по всему периоду
+        resolved = {}
+        for remote in remote_payments:
+            stats['fetched'] += 1
+            status = provider.get_status_for_state(remote['State'])
+            invoice = remote.get('SiteInvoiceID')
+            if status is None or not invoice:
+                continue
+            candidate = (status, remote['PaymentID'], remote.get('Amount'),
+                         remote.get('LastUpdateTime'))
+            current = resolved.get(invoice)
+            if current is None or _is_preferred(candidate, current):
+                resolved[invoice] = candidate
+
+        invoices = list(resolved)
+        for start in range(0, len(invoices), options['batch_size']):
+            batch = {invoice: resolved[invoice]
+                     for invoice in invoices[start:start + options['batch_size']]}
+            self._reconcile(provider, batch, stats, options)
+
+        self.stdout.write(
+            'fetched: {fetched}, matched: {matched}, confirmed: {confirmed}, '
+            'rejected: {rejected}{dry_run}'.format(
+                fetched=stats['fetched'], matched=stats['matched'],
+                confirmed=stats[PaymentStatus.CONFIRMED],
+                rejected=stats[PaymentStatus.REJECTED],
+                dry_run=' (dry run)' if options['dry_run'] else ''))
+
+    def _reconcile(self, provider, batch, stats, options):
+        """ Обновить WAITING платежи пакета с завершенным состоянием в API """
+        queryset = get_payment_model()._default_manager.filter(
+            variant=options['variant'], status=PaymentStatus.WAITING)
+        with transaction.atomic():
+            payments = provider.filter_by_payment_number(
+                queryset.select_for_update(), list(batch))
+            for payment in payments:
+                status, transaction_id, amount, _ = batch[provider.get_payment_number(payment)]
+                stats['matched'] += 1
+                stats[status] += 1
+                if options['dry_run']:
+                    continue
+                # одна запись на платеж, status, message и сигнал - как в change_status
+                with provider.metrics.timer('status_change', status=status):
+                    payment.status = status
+                    payment.message = ''
+                    payment.transaction_id = str(transaction_id)
+                    update_fields = ['status', 'message', 'transaction_id']
+                    if status == PaymentStatus.CONFIRMED and amount is not None:
+                        payment.captured_amount = Decimal(str(amount))
+                        update_fields.append('captured_amount')
+                    payment.save(update_fields=update_fields)
+                    status_changed.send(sender=type(payment), instance=payment)
@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+from payments.core import provider_factory
+
+from ...mirror import sync_payments
+
+
+class Command(BaseCommand):
+    help = ('Load payment changes since the last sync from listPaymentsFilter '
+            'into the local PaymasterPaymentMirror table')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--variant', default='paymaster')
+        parser.add_argument('--from', dest='period_from',
+                            help='period start, YYYY-MM-DD, by default the last synced change')
+        parser.add_argument('--initial-days', type=int, default=30,
+                            help='days to load into the empty table')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--chunk-days', type=int, help='split period into windows of days')
+        parser.add_argument('--concurrency', type=int, default=1,
+                            help='concurrent listPaymentsFilter requests')
+
+    def handle(self, *args, **options):
+        provider = provider_factory(options['variant'])
+        stats = sync_payments(
+            provider.api_client, merchant_id=provider.client_id,
+            period_from=options['period_from'], initial_days=options['initial_days'],
+            batch_size=options['batch_size'], chunk_days=options['chunk_days'],
+            max_concurrency=options['concurrency'])
+        self.stdout.write('fetched: {fetched}, created: {created}, updated: {updated}, '
+                          'unchanged: {unchanged}'.format(**stats))
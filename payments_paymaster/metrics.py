@@ -0,0 +1,130 @@
+"""
+Метрики провайдера и клиента REST API.
+
+Бэкенд получает длительности и счетчики с постоянным набором тегов для каждого имени:
+
+    api_request     timing   endpoint, outcome (ok или имя исключения)
+    api_retry       counter  endpoint
+    hash_check      counter  outcome (ok, fail)
+    process_data    timing   branch (status, prerequest, notification, hash_error,
+                             waiting, redirect)
+    status_change   timing   status
+
+Подключается опцией провайдера metrics: путь к классу или экземпляр,
+по умолчанию settings.METRICS_BACKEND.
+"""
+import contextlib
+import logging
+import threading
+import time
+
+
+class BaseMetrics(object):
+    """ Бэкенд метрик, достаточно реализовать timing и increment """
+
+    def timing(self, name, seconds, **tags):
+        raise NotImplementedError
+
+    def increment(self, name, value=1, **tags):
+        raise NotImplementedError
+
+    @contextlib.contextmanager
+    def timer(self, name, **tags):
+        """ Замер блока, теги можно дополнить внутри: with metrics.timer(...) as tags """
+        started = time.perf_counter()
+        try:
+            yield tags
+        finally:
+            self.timing(name, time.perf_counter() - started, **tags)
+
+
+class NullMetrics(BaseMetrics):
+    """ Метрики выключены """
+
+    def timing(self, name, seconds, **tags):
+        pass
+
+    def increment(self, name, value=1, **tags):
+        pass
+
+
+class LoggingMetrics(BaseMetrics):
+    """ Метрики в лог, для отладки """
+
+    def __init__(self, logger='paymaster.metrics'):
+        self.logger = logging.getLogger(logger)
+
+    def timing(self, name, seconds, **tags):
+        self.logger.info('%s %.2fms %s', name, seconds * 1000, tags)
+
+    def increment(self, name, value=1, **tags):
+        self.logger.info('%s +%s %s', name, value, tags)
+
+
+class StatsdMetrics(BaseMetrics):
+    """
+    Метрики в StatsD через пакет statsd. Теги добавляются к имени:
+    paymaster.api_request.getPayment.ok
+    """
+
+    def __init__(self, client=None, host='localhost', port=8125, prefix='paymaster'):
+        if client is None:
+            import statsd
+            client = statsd.StatsClient(host, port, prefix=prefix)
+        self.client = client
+
+    def _stat(self, name, tags):
+        return '.'.join([name] + [str(tags[k]) for k in sorted(tags)])
+
+    def timing(self, name, seconds, **tags):
+        self.client.timing(self._stat(name, tags), seconds * 1000)
+
+    def increment(self, name, value=1, **tags):
+        self.client.incr(self._stat(name, tags), value)
+
+
+_prometheus_collectors = {}
+_prometheus_lock = threading.Lock()
+
+
+class PrometheusMetrics(BaseMetrics):
+    """
+    Метрики в prometheus_client: timing - гистограмма <prefix>_<name>_seconds,
+    increment - счетчик <prefix>_<name>_total, теги - метки.
+    Коллекторы создаются один раз на реестр и общие для всех экземпляров,
+    повторная регистрация в реестре prometheus_client - ошибка.
+    """
+
+    def __init__(self, registry=None, prefix='paymaster', buckets=None):
+        import prometheus_client
+        self._prometheus = prometheus_client
+        self.registry = registry or prometheus_client.REGISTRY
+        self.prefix = prefix
+        self.buckets = buckets or prometheus_client.Histogram.DEFAULT_BUCKETS
+
+    def _get_metric(self, kind, name, labels):
+        key = (id(self.registry), kind, self.prefix, name)
+        metric = _prometheus_collectors.get(key)
+        if metric is None:
+            with _prometheus_lock:
+                metric = _prometheus_collectors.get(key)
+                if metric is None:
+                    full_name = '{0}_{1}'.format(self.prefix, name)
+                    if kind == 'histogram':
+                        metric = self._prometheus.Histogram(
+                            full_name + '_seconds', name, sorted(labels),
+                            registry=self.registry, buckets=self.buckets)
+                    else:
+                        metric = self._prometheus.Counter(
+                            full_name, name, sorted(labels), registry=self.registry)
+                    _prometheus_collectors[key] = metric
+        return metric.labels(**{k: str(v) for k, v in labels.items()}) if labels else metric
+
+    def timing(self, name, seconds, **tags):
+        self._get_metric('histogram', name, tags).observe(seconds)
+
+    def increment(self, name, value=1, **tags):
+        self._get_metric('counter', name, tags).inc(value)
+
+
+NULL_METRICS = NullMetrics()
@@ -0,0 +1,29 @@
+# Generated by Django 3.0.14 on 2026-10-17 21:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymasterNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('variant', models.CharField(max_length=255, verbose_name='variant')),
+                ('payment_id', models.CharField(db_index=True, max_length=64, verbose_name='payment id')),
+                ('transaction_id', models.CharField(blank=True, max_length=255, verbose_name='transaction id')),
+                ('data', models.TextField(verbose_name='data')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+            ],
+            options={
+                'verbose_name': 'Paymaster notification',
+                'verbose_name_plural': 'Paymaster notifications',
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.0.14 on 2026-10-17 21:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments_paymaster', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymasterPaymentMirror',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.BigIntegerField(unique=True, verbose_name='payment id')),
+                ('site_invoice_id', models.CharField(blank=True, db_index=True, max_length=255, verbose_name='site invoice id')),
+                ('site_id', models.CharField(blank=True, max_length=255, verbose_name='site id')),
+                ('state', models.CharField(db_index=True, max_length=32, verbose_name='state')),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='amount')),
+                ('currency_code', models.CharField(blank=True, max_length=3, verbose_name='currency')),
+                ('payment_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='payment amount')),
+                ('payment_currency_code', models.CharField(blank=True, max_length=3, verbose_name='payment currency')),
+                ('is_test_payment', models.BooleanField(default=False, verbose_name='test payment')),
+                ('payment_system_id', models.IntegerField(blank=True, null=True, verbose_name='payment system id')),
+                ('purpose', models.TextField(blank=True, verbose_name='purpose')),
+                ('user_identifier', models.CharField(blank=True, max_length=255, verbose_name='user identifier')),
+                ('user_phone_number', models.CharField(blank=True, max_length=32, verbose_name='user phone number')),
+                ('last_update_time', models.DateTimeField(db_index=True, null=True, verbose_name='last update time')),
+                ('synced', models.DateTimeField(auto_now=True, verbose_name='synced')),
+            ],
+            options={
+                'verbose_name': 'Paymaster payment',
+                'verbose_name_plural': 'Paymaster payments',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='paymasterpaymentmirror',
+            index=models.Index(fields=['site_id', 'last_update_time'], name='payments_pa_site_id_1126ed_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.0.14 on 2026-10-17 22:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments_paymaster', '0002_paymaster_payment_mirror'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paymasterpaymentmirror',
+            name='payments_pa_site_id_1126ed_idx',
+        ),
+        migrations.AddField(
+            model_name='paymasterpaymentmirror',
+            name='site_alias',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='site alias'),
+        ),
+        migrations.AddIndex(
+            model_name='paymasterpaymentmirror',
+            index=models.Index(fields=['site_alias', 'last_update_time'], name='payments_pa_site_al_f49577_idx'),
+        ),
+    ]
@@ -0,0 +1,132 @@
+"""
+Синхронизация локальной копии платежей PaymasterPaymentMirror с listPaymentsFilter.
+
+Запрашиваются только изменения с отметки: максимального LastUpdateTime в таблице
+за вычетом overlap, так как API фильтрует по датам без времени. Платежи записываются
+пакетами в одной транзакции: новые через bulk_create, измененные через update по pk.
+Синхронизация одного сайта не должна запускаться параллельно.
+"""
+import datetime
+from decimal import Decimal
+
+from django.conf import settings as django_settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import PaymasterPaymentMirror
+
+# поле модели: ключ API
+MIRROR_FIELDS = (
+    ('site_invoice_id', 'SiteInvoiceID'),
+    ('site_id', 'SiteID'),
+    ('state', 'State'),
+    ('amount', 'Amount'),
+    ('currency_code', 'CurrencyCode'),
+    ('payment_amount', 'PaymentAmount'),
+    ('payment_currency_code', 'PaymentCurrencyCode'),
+    ('is_test_payment', 'IsTestPayment'),
+    ('payment_system_id', 'PaymentSystemID'),
+    ('purpose', 'Purpose'),
+    ('user_identifier', 'UserIdentifier'),
+    ('user_phone_number', 'UserPhoneNumber'),
+    ('last_update_time', 'LastUpdateTime'),
+)
+
+
+def get_high_water_mark(merchant_id=None):
+    """
+    Время последнего изменения среди платежей, загруженных для сайта merchant_id.
+    Отбор идет по site_alias: SiteID в ответах API - другой идентификатор сайта
+    """
+    return PaymasterPaymentMirror.objects.filter(site_alias=merchant_id or '').aggregate(
+        value=Max('last_update_time'))['value']
+
+
+def _to_decimal(value):
+    if value is None or isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+def _to_datetime(value):
+    # LastUpdateTime приходит в UTC
+    if value and django_settings.USE_TZ and timezone.is_naive(value):
+        return timezone.make_aware(value, timezone.utc)
+    return value
+
+
+def mirror_values(payment):
+    """ Значения полей модели для платежа из API, dict или rest_api.records.PaymasterPayment """
+    values = {field: payment.get(key) for field, key in MIRROR_FIELDS}
+    values['amount'] = _to_decimal(values['amount'])
+    values['payment_amount'] = _to_decimal(values['payment_amount'])
+    values['last_update_time'] = _to_datetime(values['last_update_time'])
+    values['is_test_payment'] = bool(values['is_test_payment'])
+    if values['site_id'] is not None:
+        values['site_id'] = str(values['site_id'])
+    for field in ('site_invoice_id', 'site_id', 'currency_code', 'payment_currency_code',
+                  'purpose', 'user_identifier', 'user_phone_number'):
+        if values[field] is None:
+            values[field] = ''
+    return values
+
+
+def _save_batch(batch, stats):
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {mirror.payment_id: mirror for mirror in
+                    PaymasterPaymentMirror.objects.filter(payment_id__in=list(batch))}
+        to_create, to_update = [], []
+        for payment_id, values in batch.items():
+            mirror = existing.get(payment_id)
+            if mirror is None:
+                to_create.append(PaymasterPaymentMirror(payment_id=payment_id, synced=now,
+                                                        **values))
+                continue
+            if all(getattr(mirror, field) == value for field, value in values.items()):
+                stats['unchanged'] += 1
+                continue
+            to_update.append((mirror.pk, values))
+        PaymasterPaymentMirror.objects.bulk_create(to_create)
+        for pk, values in to_update:
+            PaymasterPaymentMirror.objects.filter(pk=pk).update(synced=now, **values)
+    stats['created'] += len(to_create)
+    stats['updated'] += len(to_update)
+
+
+def sync_payments(client, merchant_id=None, period_from=None, initial_days=30,
+                  overlap=datetime.timedelta(days=1), batch_size=500, chunk_days=None,
+                  max_concurrency=1):
+    """
+    Загрузить изменения платежей с последней отметки
+    :param client: PaymasterApiClient
+    :param merchant_id: siteAlias сайта, по умолчанию все сайты аккаунта;
+        отметка ведется отдельно для каждого значения
+    :param period_from: начало периода вместо отметки, например для полной перезагрузки
+    :param initial_days: глубина первой загрузки в пустую таблицу, дней
+    :param overlap: запас перед отметкой на часовые пояса и запаздывающие изменения
+    :param batch_size: платежей в одной транзакции
+    :return: dict счетчиков fetched, created, updated, unchanged
+    """
+    if period_from is None:
+        high_water_mark = get_high_water_mark(merchant_id)
+        if high_water_mark is None:
+            period_from = timezone.now() - datetime.timedelta(days=initial_days)
+        else:
+            period_from = high_water_mark - overlap
+
+    stats = {'fetched': 0, 'created': 0, 'updated': 0, 'unchanged': 0}
+    batch = {}
+    for payment in client.iter_payments(period_from, merchant_id=merchant_id,
+                                        chunk_days=chunk_days, max_concurrency=max_concurrency):
+        stats['fetched'] += 1
+        values = mirror_values(payment)
+        values['site_alias'] = merchant_id or ''
+        batch[payment['PaymentID']] = values
+        if len(batch) >= batch_size:
+            _save_batch(batch, stats)
+            batch = {}
+    if batch:
+        _save_batch(batch, stats)
+    return stats
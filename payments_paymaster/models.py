@@ -0,0 +1,64 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+from .utils import load_notification
+
+
+class PaymasterNotification(models.Model):
+    """
+    Журнал уведомлений об оплате при notification_storage='model'.
+    Записи только добавляются. Платеж хранится идентификатором без внешнего ключа,
+    так как модель платежа задается в проекте, а журнал переживает удаление платежей.
+    """
+    variant = models.CharField(_('variant'), max_length=255)
+    payment_id = models.CharField(_('payment id'), max_length=64, db_index=True)
+    transaction_id = models.CharField(_('transaction id'), max_length=255, blank=True)
+    data = models.TextField(_('data'))
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Paymaster notification')
+        verbose_name_plural = _('Paymaster notifications')
+
+    def __str__(self):
+        return '{0} {1}'.format(self.payment_id, self.transaction_id)
+
+    def get_data(self):
+        return load_notification(self.data)
+
+
+class PaymasterPaymentMirror(models.Model):
+    """
+    Локальная копия платежей из listPaymentsFilter для отчетов и сверки,
+    заполняется mirror.sync_payments
+    """
+    payment_id = models.BigIntegerField(_('payment id'), unique=True)
+    site_invoice_id = models.CharField(_('site invoice id'), max_length=255, blank=True,
+                                       db_index=True)
+    site_id = models.CharField(_('site id'), max_length=255, blank=True)
+    # siteAlias (LMI_MERCHANT_ID) синхронизации, отличается от SiteID из API
+    site_alias = models.CharField(_('site alias'), max_length=255, blank=True, default='')
+    state = models.CharField(_('state'), max_length=32, db_index=True)
+    amount = models.DecimalField(_('amount'), max_digits=12, decimal_places=2,
+                                 null=True, blank=True)
+    currency_code = models.CharField(_('currency'), max_length=3, blank=True)
+    payment_amount = models.DecimalField(_('payment amount'), max_digits=12, decimal_places=2,
+                                         null=True, blank=True)
+    payment_currency_code = models.CharField(_('payment currency'), max_length=3, blank=True)
+    is_test_payment = models.BooleanField(_('test payment'), default=False)
+    payment_system_id = models.IntegerField(_('payment system id'), null=True, blank=True)
+    purpose = models.TextField(_('purpose'), blank=True)
+    user_identifier = models.CharField(_('user identifier'), max_length=255, blank=True)
+    user_phone_number = models.CharField(_('user phone number'), max_length=32, blank=True)
+    last_update_time = models.DateTimeField(_('last update time'), null=True, db_index=True)
+    synced = models.DateTimeField(_('synced'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('Paymaster payment')
+        verbose_name_plural = _('Paymaster payments')
+        indexes = [
+            models.Index(fields=['site_alias', 'last_update_time']),
+        ]
+
+    def __str__(self):
+        return '{0} {1}'.format(self.payment_id, self.state)
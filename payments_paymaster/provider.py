@@ -1,19 +1,28 @@
 import datetime
-import json
 import logging
-import time
 from base64 import b64encode
+from typing import TYPE_CHECKING
 
-from django.http import HttpResponse
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect
+from django.template.response import TemplateResponse
 from django.utils.encoding import smart_bytes, smart_str
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
 from payments import PaymentStatus
 from payments.core import BasicProvider
-from payments.models import BasePayment
 
 from . import settings
-from .rest_api.client import PaymasterApiClient
-from .utils import calculate_hash
+from .constants import (
+    API_VERIFY_DEFERRED, API_VERIFY_MODES, NOTIFICATION_STORAGE_MODEL, NOTIFICATION_STORAGES,
+    WAITING_MODE_REFRESH, WAITING_MODES, PaymentState,
+)
+from .metrics import NULL_METRICS
+from .utils import Signer, dump_notification, load_notification
+
+if TYPE_CHECKING:
+    from payments.models import BasePayment
 
 logger = logging.getLogger(__name__)
 
@@ -35,81 +44,320 @@ class PaymasterProvider(BasicProvider):
         self.api_login = kwargs.pop('api_login')
         self.api_password = kwargs.pop('api_password')
         self.api_verify = kwargs.pop('api_verify', False)
+        self.api_verify_mode = kwargs.pop('api_verify_mode', settings.API_VERIFY_MODE)
+        assert self.api_verify_mode in API_VERIFY_MODES
+        self._verification_backend = kwargs.pop('verification_backend',
+                                                settings.VERIFICATION_BACKEND)
+        self.api_timeout = kwargs.pop('api_timeout', settings.API_TIMEOUT)
+        self.api_pool_size = kwargs.pop('api_pool_size', settings.API_POOL_SIZE)
+        self.api_max_retries = kwargs.pop('api_max_retries', settings.API_MAX_RETRIES)
+        self.api_cache = kwargs.pop('api_cache', None)
+        self.api_rate_limit = kwargs.pop('api_rate_limit', settings.API_RATE_LIMIT)
+        self.api_rate_burst = kwargs.pop('api_rate_burst', settings.API_RATE_BURST)
+        self.api_max_concurrency = kwargs.pop('api_max_concurrency', settings.API_MAX_CONCURRENCY)
+        self.api_retries = kwargs.pop('api_retries', settings.API_RETRIES)
+        self.api_retry_backoff = kwargs.pop('api_retry_backoff', settings.API_RETRY_BACKOFF)
+        self.api_circuit_failures = kwargs.pop('api_circuit_failures',
+                                               settings.API_CIRCUIT_FAILURES)
+        self.api_circuit_recovery = kwargs.pop('api_circuit_recovery',
+                                               settings.API_CIRCUIT_RECOVERY)
+        self._metrics = kwargs.pop('metrics', settings.METRICS_BACKEND)
+        self.api_endpoint = kwargs.pop('api_endpoint', None)
 
         self.sim_mode = kwargs.pop('sim_mode', None)
         self.payment_method = kwargs.pop('payment_method', None)
 
+        self._static_hidden_fields = {
+            'LMI_MERCHANT_ID': self.client_id,
+            'LMI_SHOP_ID': self.shop_id,
+            'LMI_SIM_MODE': self.sim_mode,
+            'LMI_PAYMENT_METHOD': self.payment_method,
+        }
+
         self.hash_fields = kwargs.pop('hash_fields', settings.HASH_FIELDS)
         self.hash_method = kwargs.pop('hash_method', settings.HASH_METHOD)
         self.hash_fail_http_code = kwargs.pop('hash_fail_http_code', settings.HASH_FAIL_HTTP_CODE)
+        self.signer = Signer(self.hash_fields,
+                             suffix=u';{0}'.format(self.secret),
+                             hash_method=self.hash_method)
+
+        self.notification_fields = kwargs.pop('notification_fields',
+                                              settings.NOTIFICATION_FIELDS)
+        self.notification_compress = kwargs.pop('notification_compress',
+                                                settings.NOTIFICATION_COMPRESS)
+        self.notification_storage = kwargs.pop('notification_storage',
+                                               settings.NOTIFICATION_STORAGE)
+        assert self.notification_storage in NOTIFICATION_STORAGES
+
+        self.waiting_mode = kwargs.pop('waiting_mode', settings.WAITING_MODE)
+        assert self.waiting_mode in WAITING_MODES
+        self.waiting_poll_interval = kwargs.pop('waiting_poll_interval',
+                                                settings.WAITING_POLL_INTERVAL)
+        self.waiting_template = kwargs.pop('waiting_template', settings.WAITING_TEMPLATE)
         super().__init__(**kwargs)
 
+    @cached_property
+    def api_client(self):
+        """
+        Клиент REST API, один на время жизни провайдера.
+        Импортируется здесь, чтобы requests не загружался без обращений к API
+        """
+        from .rest_api.client import PaymasterApiClient, get_session
+        from .rest_api.retry import RetryPolicy, get_circuit_breaker
+        from .rest_api.throttling import get_throttle
+
+        cache = self.api_cache
+        if isinstance(cache, str):
+            cache = import_string(cache)()
+        return PaymasterApiClient(
+            login=self.api_login,
+            password=self.api_password,
+            session=get_session(self.api_pool_size, self.api_max_retries),
+            timeout=self.api_timeout,
+            endpoint=self.api_endpoint,
+            cache=cache,
+            throttle=get_throttle(self.api_rate_limit, self.api_rate_burst,
+                                  self.api_max_concurrency),
+            retry=RetryPolicy(self.api_retries, self.api_retry_backoff),
+            circuit_breaker=get_circuit_breaker(
+                self.api_endpoint or PaymasterApiClient.endpoint,
+                self.api_circuit_failures, self.api_circuit_recovery),
+            metrics=self.metrics,
+        )
+
+    @cached_property
+    def metrics(self):
+        """ Бэкенд метрик, путь к классу или экземпляр, по умолчанию выключен """
+        metrics = self._metrics
+        if metrics is None:
+            return NULL_METRICS
+        if isinstance(metrics, str):
+            metrics = import_string(metrics)()
+        return metrics
+
+    @cached_property
+    def verification_backend(self):
+        """ Бэкенд отложенной проверки, путь к классу или экземпляр """
+        backend = self._verification_backend
+        if isinstance(backend, str):
+            backend = import_string(backend)()
+        return backend
+
     def get_action(self, payment):
         return self._action
 
-    def get_payment_number(self, payment: BasePayment):
+    def get_payment_number(self, payment: 'BasePayment'):
         return payment.token
 
-    def get_payer_phone(self, payment: BasePayment):
+    def get_payer_phone(self, payment: 'BasePayment'):
         return None
 
-    def get_payer_email(self, payment: BasePayment):
+    def get_payer_email(self, payment: 'BasePayment'):
         return payment.billing_email
 
-    def get_description(self, payment: BasePayment):
+    def get_description(self, payment: 'BasePayment'):
         description = payment.description
         if not description:
             return 'Payment'
         return description
 
-    def get_hidden_fields(self, payment: BasePayment):
+    def get_hidden_fields(self, payment: 'BasePayment'):
+        """
+        Поля формы оплаты. Поля провайдера вычисляются один раз в конструкторе,
+        поля платежа кешируются на экземпляре платежа, пока не изменятся его данные.
+        """
+        description = self.get_description(payment)
+        payment_no = self.get_payment_number(payment)
+        phone = self.get_payer_phone(payment)
+        email = self.get_payer_email(payment)
+        key = (payment_no, payment.token, str(payment.total), payment.currency,
+               description, phone, email)
+
+        cached = getattr(payment, '_paymaster_hidden_fields', None)
+        if cached is not None and cached[0] == key:
+            return dict(cached[1])
+
         return_url = self.get_return_url(payment)
         expire = datetime.datetime.now() + datetime.timedelta(days=1)
-        description = self.get_description(payment)
-        data = {
-            'LMI_MERCHANT_ID': self.client_id,
-            'LMI_SHOP_ID': self.shop_id,
+        data = dict(self._static_hidden_fields)
+        data.update({
             'LMI_CURRENCY': payment.currency,
-            'LMI_SIM_MODE': self.sim_mode,
             'LMI_PAYMENT_AMOUNT': str(payment.total),
-            'LMI_PAYMENT_NO': self.get_payment_number(payment),
+            'LMI_PAYMENT_NO': payment_no,
             'LMI_PAYMENT_DESC': description,
             'LMI_PAYMENT_DESC_BASE64': smart_str(b64encode(smart_bytes(description))),
-            'LMI_PAYER_PHONE_NUMBER': self.get_payer_phone(payment),
-            'LMI_PAYER_EMAIL': self.get_payer_email(payment),
+            'LMI_PAYER_PHONE_NUMBER': phone,
+            'LMI_PAYER_EMAIL': email,
             'LMI_EXPIRES': f'{expire:%Y-%m-%dT%H:%M:%S}',
-            'LMI_PAYMENT_METHOD': self.payment_method,
             'LMI_SUCCESS_URL': return_url,
             'LMI_FAILURE_URL': return_url,
             'LMI_INVOICE_CONFIRMATION_URL': return_url,
             'LMI_PAYMENT_NOTIFICATION_URL': return_url,
             'PAYMENT_TOKEN': payment.token,
-        }
+        })
         data = {k: v for k, v in data.items() if v is not None}
-        return data
+        payment._paymaster_hidden_fields = (key, data)
+        return dict(data)
 
     def get_token_from_request(self, payment, request):
         return request.POST.get('PAYMENT_TOKEN')
 
     def verify_hash(self, data):
         """ Проверка ключа безопасности """
-        _hash = calculate_hash(data,
-                               password=self.secret,
-                               hashed_fields=self.hash_fields,
-                               hash_method=self.hash_method)
-        return _hash == data.get('LMI_HASH')
-
-    def invoice_confirmation(self, payment: BasePayment, request):
-        payment.change_status(PaymentStatus.WAITING)
+        valid = self.signer.verify(data, data.get('LMI_HASH'))
+        self.metrics.increment('hash_check', outcome='ok' if valid else 'fail')
+        return valid
+
+    def change_status(self, payment: 'BasePayment', status):
+        """ Смена статуса с замером времени записи в БД и обработчиков status_changed """
+        with self.metrics.timer('status_change', status=status):
+            payment.change_status(status)
+
+    def invoice_confirmation(self, payment: 'BasePayment', request):
+        self.change_status(payment, PaymentStatus.WAITING)
         return HttpResponse('YES', content_type='text/plain')
 
-    def process_data(self, payment: BasePayment, request):
+    def status_response(self, payment: 'BasePayment', request):
+        """ Дешевый json статуса для страницы ожидания """
+        response = JsonResponse({
+            'status': payment.status,
+            'waiting': payment.status == PaymentStatus.WAITING,
+        })
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def waiting_response(self, payment: 'BasePayment', request):
+        """ Ответ браузеру, пока не пришло уведомление об оплате """
+        if self.waiting_mode == WAITING_MODE_REFRESH:
+            response = HttpResponse('', content_type='text/plain')
+            response['Refresh'] = '{0}; url={1}'.format(self.waiting_poll_interval, request.path)
+        else:
+            response = TemplateResponse(request, self.waiting_template, {
+                'payment': payment,
+                'return_url': request.path,
+                'status_url': request.path + '?format=json',
+                'poll_interval': self.waiting_poll_interval,
+            })
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def _lock_payment(self, payment: 'BasePayment'):
+        """
+        Блокировка строки платежа до конца транзакции,
+        обновляет status и transaction_id платежа, возвращает актуальный статус
+        """
+        queryset = type(payment)._default_manager.select_for_update().filter(pk=payment.pk)
+        payment.status, payment.transaction_id = queryset.values_list(
+            'status', 'transaction_id').get()
+        return payment.status
+
+    def process_notification(self, payment: 'BasePayment', data):
+        """
+        Обработка уведомления об оплате.
+        Paymaster повторяет уведомления, поэтому уже обработанные отсекаются без запросов к API,
+        а конкурентные обрабатываются по очереди под блокировкой строки платежа.
+        Повтор уведомления, уже записанного в платеж, ждущий проверки, тоже отсекается:
+        проверка поставлена первым уведомлением.
+        """
+        transaction_id = data['LMI_SYS_PAYMENT_ID']
+        if payment.status != PaymentStatus.WAITING:
+            if payment.transaction_id != transaction_id:
+                logger.warning(u'Invoice %s: notification %s for processed payment %s',
+                               data.get('LMI_PAYMENT_NO'), transaction_id,
+                               payment.transaction_id)
+            return HttpResponse('')
+
+        with transaction.atomic():
+            self._lock_payment(payment)
+            if payment.status != PaymentStatus.WAITING or payment.transaction_id == transaction_id:
+                return HttpResponse('')
+
+            payment.captured_amount = data['LMI_PAID_AMOUNT']
+            payment.transaction_id = transaction_id
+            update_fields = ['captured_amount', 'transaction_id']
+            update_fields.extend(self.store_notification(payment, data))
+            payment.save(update_fields=update_fields)
+            if not self.api_verify:
+                self.change_status(payment, PaymentStatus.CONFIRMED)
+                return HttpResponse('')
+            if self.api_verify_mode == API_VERIFY_DEFERRED:
+                # Платеж ждет проверки в статусе WAITING с заполненным transaction_id
+                variant, pk = payment.variant, payment.pk
+                transaction.on_commit(lambda: self.verification_backend.enqueue(variant, pk))
+                return HttpResponse('')
+        # запрос к API после коммита, строка платежа не блокируется на время запроса
+        self.apply_api_state(payment)
+        return HttpResponse('')
+
+    def store_notification(self, payment: 'BasePayment', data):
+        """
+        Сохранить уведомление согласно notification_storage
+        :return: измененные поля платежа
+        """
+        dumped = dump_notification(data, self.notification_fields, self.notification_compress)
+        if self.notification_storage == NOTIFICATION_STORAGE_MODEL:
+            from .models import PaymasterNotification
+            PaymasterNotification.objects.create(
+                variant=payment.variant, payment_id=str(payment.pk),
+                transaction_id=data.get('LMI_SYS_PAYMENT_ID') or '', data=dumped)
+            return []
+        payment.extra_data = dumped
+        return ['extra_data']
+
+    def get_notification(self, payment: 'BasePayment'):
+        """ Последнее сохраненное уведомление платежа, dict полей """
+        if self.notification_storage == NOTIFICATION_STORAGE_MODEL:
+            from .models import PaymasterNotification
+            notification = PaymasterNotification.objects.filter(
+                variant=payment.variant, payment_id=str(payment.pk)).order_by('-pk').first()
+            return notification.get_data() if notification is not None else {}
+        return load_notification(payment.extra_data)
+
+    def apply_api_state(self, payment: 'BasePayment'):
+        """
+        Обновить статус платежа по данным getPayment.
+        Запрос к API выполняется без блокировки, статус меняется под блокировкой строки,
+        только если платеж все еще в статусе WAITING
+        :return: True, если платеж завершен
+        """
+        response = self.api_client.get_payment(payment.transaction_id)
+        status = self.get_status_for_state(response['State'])
+        if status is None:
+            return False
+        with transaction.atomic():
+            if self._lock_payment(payment) == PaymentStatus.WAITING:
+                self.change_status(payment, status)
+        return True
+
+    def get_status_for_state(self, state):
+        """ Статус платежа для завершенного состояния в API, None для незавершенных """
+        if state == PaymentState.COMPLETE:
+            return PaymentStatus.CONFIRMED
+        if state == PaymentState.CANCELLED:
+            return PaymentStatus.REJECTED
+        return None
+
+    def filter_by_payment_number(self, queryset, numbers):
+        """ Отбор платежей по номерам счетов LMI_PAYMENT_NO, парный get_payment_number """
+        return queryset.filter(token__in=numbers)
+
+    def process_data(self, payment: 'BasePayment', request):
+        with self.metrics.timer('process_data', branch='redirect') as tags:
+            return self._process_data(payment, request, tags)
+
+    def _process_data(self, payment: 'BasePayment', request, tags):
+        if request.GET.get('format') == 'json':
+            tags['branch'] = 'status'
+            return self.status_response(payment, request)
+
         data = request.POST.copy()
         if data.get('LMI_PREREQUEST'):
+            tags['branch'] = 'prerequest'
             return self.invoice_confirmation(payment, request)
 
         if 'LMI_HASH' in data:
             if not self.verify_hash(data):
+                tags['branch'] = 'hash_error'
                 logger.debug(u'NotificationPaid error. Data: %s, hashed_fields: %s',
                              request.POST.dict(), self.hash_fields)
                 logger.error(
@@ -118,28 +366,13 @@ class PaymasterProvider(BasicProvider):
 
                 return HttpResponse('HashError', status=self.hash_fail_http_code)
 
-            if payment.status == PaymentStatus.WAITING:
-                payment.extra_data = json.dumps(data, indent=2)
-                payment.captured_amount = data['LMI_PAID_AMOUNT']
-                payment.transaction_id = data['LMI_SYS_PAYMENT_ID']
-                api_client = PaymasterApiClient(
-                    login=self.api_login,
-                    password=self.api_password
-                )
-                if self.api_verify:
-                    response = api_client.get_payment(payment.transaction_id)
-                    if response['State'] == PaymasterApiClient.PaymentState.COMPLETE:
-                        payment.change_status(PaymentStatus.CONFIRMED)
-                    elif response['State'] == PaymasterApiClient.PaymentState.CANCELLED:
-                        payment.change_status(PaymentStatus.REJECTED)
-                else:
-                    payment.change_status(PaymentStatus.CONFIRMED)
-                return HttpResponse('')
+            tags['branch'] = 'notification'
+            return self.process_notification(payment, data)
 
         if payment.status == PaymentStatus.WAITING:
             # Ждем оплаты
-            time.sleep(3)
-            return redirect('.')
+            tags['branch'] = 'waiting'
+            return self.waiting_response(payment, request)
 
         success_url = payment.get_success_url()
         failure_url = payment.get_failure_url()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from urllib.parse import urljoin
+
+import httpx
+
+from .client import BasePaymasterApiClient
+from .exceptions import BaseApiError
+from .. import settings
+from ..metrics import NULL_METRICS
+
+logger = logging.getLogger('paymaster.rest_client')
+
+
+class AsyncAPIClient(object):
+    endpoint = None
+    timeout = None
+
+    def __init__(self, http_client=None, timeout=None, pool_size=settings.API_POOL_SIZE,
+                 endpoint=None):
+        """
+        :param http_client: httpx.AsyncClient, by default own client with connection pool
+        :param timeout: seconds
+        :param pool_size: max keep-alive connections of own client
+        :param endpoint: base url of API
+        """
+        if timeout is not None:
+            self.timeout = timeout
+        if endpoint is not None:
+            self.endpoint = endpoint
+        self._own_http_client = http_client is None
+        if http_client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=pool_size,
+                                    max_keepalive_connections=pool_size),
+            )
+        self.http_client = http_client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._own_http_client:
+            await self.http_client.aclose()
+
+    def _compose_url(self, path):
+        return urljoin(self.endpoint, path)
+
+    def _get_request_kwargs(self, path, data, params, method):
+        """
+        Can be override. Kwargs is httpx kwargs
+        :param path:
+        :param data:
+        :param method:
+        :return:
+        """
+        if params is not None:
+            # requests skips None params, keep the same query for both clients
+            params = {k: v for k, v in params.items() if v is not None}
+        return {
+            'data': data,
+            'params': params,
+            'timeout': self.timeout,
+        }
+
+    def _handle_error(self, response, path=None):
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            logger.exception(response.content)
+            raise e
+
+    async def _request(self, path, params=None, data=None, method='GET', **kwargs):
+        _url = self._compose_url(path)
+
+        call_kwargs = self._get_request_kwargs(path=path, data=data, params=params, method=method)
+        call_kwargs.update(kwargs)
+        response = await self.http_client.request(method, _url, **call_kwargs)
+        self._handle_error(response, path)
+        return response
+
+    async def _get(self, path, params=None, **kwargs):
+        return await self._request(path, params=params, method='GET', **kwargs)
+
+    async def _post(self, path, data=None, **kwargs):
+        return await self._request(path, data=data, method='POST', **kwargs)
+
+
+class AsyncPaymasterApiClient(BasePaymasterApiClient, AsyncAPIClient):
+    """
+    Асинхронный клиент для ASGI. Методы те же, что у PaymasterApiClient, но возвращают корутины:
+
+        async with AsyncPaymasterApiClient(login, password) as client:
+            payment = await client.get_payment(payment_id)
+    """
+
+    def __init__(self, login, password, http_client=None, timeout=None,
+                 pool_size=settings.API_POOL_SIZE, endpoint=None, metrics=None, records=None):
+        super(AsyncPaymasterApiClient, self).__init__(
+            http_client=http_client, timeout=timeout, pool_size=pool_size, endpoint=endpoint)
+        self.login = login
+        self.password = password
+        self.metrics = metrics or NULL_METRICS
+        if records is not None:
+            self.records = records
+
+    def _handle_error(self, response, path=None):
+        super(AsyncPaymasterApiClient, self)._handle_error(response, path)
+        self._check_error_code(response, path)
+
+    async def _call(self, path, params, fields, parse, **kwargs):
+        with self.metrics.timer('api_request', endpoint=path, outcome='ok') as tags:
+            try:
+                params = self._auth_params(params, fields)
+                response = await self._get(path, params=params, **kwargs)
+                return parse(response)
+            except Exception as e:
+                tags['outcome'] = type(e).__name__
+                raise
+
+    async def get_payments_bulk(self, ids, merchant_id=None,
+                                max_concurrency=settings.API_POOL_SIZE):
+        """
+        Асинхронный вариант PaymasterApiClient.get_payments_bulk:
+
+            async for payment_id, payment in client.get_payments_bulk(ids):
+                ...
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch(_id):
+            async with semaphore:
+                try:
+                    return _id, await self._get_bulk_item(_id, merchant_id)
+                except (BaseApiError, httpx.HTTPError) as e:
+                    return _id, e
+
+        for task in asyncio.as_completed([fetch(_id) for _id in ids]):
+            yield await task
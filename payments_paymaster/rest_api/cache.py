@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .. import settings
+from ..constants import PaymentState
+
+FINAL_STATES = (PaymentState.COMPLETE, PaymentState.CANCELLED)
+
+
+class PaymentCache(object):
+    """
+    Кеш результатов getPayment/getPaymentByInvoiceID.
+    Завершенные платежи хранятся final_ttl секунд, остальные - ttl.
+    Номер счета кешируется как ссылка на идентификатор платежа,
+    поэтому для сброса достаточно идентификатора платежа.
+    """
+
+    def __init__(self, ttl=settings.API_CACHE_TTL, final_ttl=settings.API_CACHE_FINAL_TTL):
+        self.ttl = ttl
+        self.final_ttl = final_ttl
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+    def _payment_key(self, payment_id):
+        return 'payment:{0}'.format(payment_id)
+
+    def _invoice_key(self, invoice_id, merchant_id):
+        return 'invoice:{0}:{1}'.format(merchant_id, invoice_id)
+
+    def get_ttl(self, payment):
+        return self.final_ttl if payment.get('State') in FINAL_STATES else self.ttl
+
+    def get_payment(self, payment_id):
+        payment = self._get(self._payment_key(payment_id))
+        return payment.copy() if payment is not None else None
+
+    def get_payment_by_invoice_id(self, invoice_id, merchant_id):
+        payment_id = self._get(self._invoice_key(invoice_id, merchant_id))
+        if payment_id is None:
+            return None
+        return self.get_payment(payment_id)
+
+    def set_payment(self, payment, invoice_id=None, merchant_id=None):
+        payment_id = payment['PaymentID']
+        self._set(self._payment_key(payment_id), payment.copy(), self.get_ttl(payment))
+        if invoice_id is not None:
+            self._set(self._invoice_key(invoice_id, merchant_id), payment_id, self.final_ttl)
+
+    def invalidate(self, payment_id):
+        self._delete(self._payment_key(payment_id))
+
+
+class LocMemPaymentCache(PaymentCache):
+    """ LRU кеш в памяти процесса """
+
+    def __init__(self, max_size=settings.API_CACHE_SIZE, **kwargs):
+        super(LocMemPaymentCache, self).__init__(**kwargs)
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class DjangoPaymentCache(PaymentCache):
+    """ Кеш через django cache framework, общий для процессов """
+
+    def __init__(self, alias='default', key_prefix='paymaster', **kwargs):
+        super(DjangoPaymentCache, self).__init__(**kwargs)
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _key(self, key):
+        return '{0}:{1}'.format(self.key_prefix, key)
+
+    def _get(self, key):
+        return self.cache.get(self._key(key))
+
+    def _set(self, key, value, ttl):
+        self.cache.set(self._key(key), value, ttl)
+
+    def _delete(self, key):
+        self.cache.delete(self._key(key))
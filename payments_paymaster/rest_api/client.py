@@ -1,23 +1,78 @@
-import base64
 import datetime
-import hashlib
 import logging
-import re
-from collections import OrderedDict, namedtuple
+import os
+import threading
+from collections import OrderedDict
+from operator import itemgetter
 from urllib.parse import urljoin
 from uuid import uuid4
 
 import requests
-
-from .exceptions import PAYMASTER_ERROR_CODES, ApiError
-from ..constants import INVOICE_REJECTED
-from ..utils import parse_datetime
+from django.utils.functional import cached_property
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .exceptions import (
+    PAYMASTER_ERROR_CODES, ApiError, BaseApiError, PaymasterNetworkError, PaymasterUnavailable,
+    PaymentSystemDisabled, PaymentSystemNetworkError)
+from .records import PaymasterDocument, PaymasterPayment, PaymasterRefund
+from .. import settings
+from ..constants import INVOICE_REJECTED, PaymentState
+from ..metrics import NULL_METRICS
+from ..utils import Signer, imap_unordered, parse_datetime, parse_datetimes, parse_ms_date
 
 logger = logging.getLogger('paymaster.rest_client')
 
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def build_session(pool_size=settings.API_POOL_SIZE, max_retries=settings.API_MAX_RETRIES):
+    """
+    Keep-alive сессия с пулом соединений.
+    Повторяются только ошибки соединения: запрос еще не отправлен, nonce не потрачен.
+    :param pool_size: максимум соединений в пуле на хост
+    :param max_retries: количество повторов при ошибке соединения
+    :return: requests.Session
+    """
+    retry = Retry(total=max_retries, connect=max_retries, read=0, status=0,
+                  backoff_factor=0.1)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(pool_size=settings.API_POOL_SIZE, max_retries=settings.API_MAX_RETRIES):
+    """
+    Общая на процесс сессия для заданных настроек пула.
+    После fork создается новая, пулы соединений между процессами не делятся.
+    """
+    key = (os.getpid(), pool_size, max_retries)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = build_session(pool_size, max_retries)
+    return session
+
 
 class APIClient(object):
     endpoint = None
+    timeout = None
+
+    def __init__(self, session=None, timeout=None, endpoint=None, throttle=None):
+        """
+        :param throttle: rest_api.throttling.Throttle, shared rate and concurrency limits
+        """
+        self.session = session or get_session()
+        self.throttle = throttle
+        if timeout is not None:
+            self.timeout = timeout
+        if endpoint is not None:
+            self.endpoint = endpoint
 
     def _compose_url(self, path):
         return urljoin(self.endpoint, path)
@@ -33,56 +88,83 @@ class APIClient(object):
         return {
             'data': data,
             'params': params,
+            'timeout': self.timeout,
         }
 
-    def _handle_error(self, response):
+    def _handle_error(self, response, path=None):
         try:
             response.raise_for_status()
         except requests.HTTPError as e:
             logger.exception(response.content)
             raise e
 
-    def _request(self, path, params=None, data=None, method='GET', **kwargs):
-        method_call = getattr(requests, method.lower())
+    def _is_overload(self, error):
+        """ Error means the API is overloaded, throttle lowers concurrency """
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        response = getattr(error, 'response', None)
+        if response is None:
+            return False
+        return response.status_code == 429 or response.status_code >= 500
+
+    def _send(self, path, params=None, data=None, method='GET', **kwargs):
+        method_call = getattr(self.session, method.lower())
         _url = self._compose_url(path)
 
         call_kwargs = self._get_request_kwargs(path=path, data=data, params=params, method=method)
         call_kwargs.update(kwargs)
         response = method_call(_url, **call_kwargs)
-        self._handle_error(response)
+        self._handle_error(response, path)
         return response
 
-    def _get(self, path, params=None):
-        return self._request(path, params=params, method='GET')
-
-    def _post(self, path, data=None):
-        return self._request(path, data=data, method='POST')
+    def _request(self, path, params=None, data=None, method='GET', **kwargs):
+        if self.throttle is None:
+            return self._send(path, params=params, data=data, method=method, **kwargs)
+        with self.throttle.slot() as slot:
+            try:
+                return self._send(path, params=params, data=data, method=method, **kwargs)
+            except Exception as e:
+                slot.overloaded = self._is_overload(e)
+                raise
 
+    def _get(self, path, params=None, **kwargs):
+        return self._request(path, params=params, method='GET', **kwargs)
 
-PaymentState = namedtuple('PaymentState', [
-    'INITIATED',
-    'PROCESSING',
-    'COMPLETE',
-    'CANCELLED',
-])(
-    'INITIATED',
-    'PROCESSING',
-    'COMPLETE',
-    'CANCELLED',
-)
+    def _post(self, path, data=None, **kwargs):
+        return self._request(path, data=data, method='POST', **kwargs)
 
 
-class PaymasterApiClient(APIClient):
+class BasePaymasterApiClient(object):
+    """
+    Общая часть синхронного и асинхронного клиентов: подпись запросов и разбор ответов.
+    Транспорт реализуется в методе _call
+    """
     endpoint = 'https://paymaster.ru/partners/rest/'
+    timeout = settings.API_TIMEOUT
 
     PaymentState = PaymentState
+    # записи rest_api.records вместо dict
+    records = False
+    # повтор после таймаута или 5xx может выполнить операцию дважды
+    NON_IDEMPOTENT = ('refundPayment',)
+    # отдают содержимое файла, ошибки приходят json
+    BINARY_CONTENT = ('getDocumentContent',)
+
+    def _call(self, path, params, fields, parse, **kwargs):
+        """
+        Подписать и выполнить запрос к API
+        :param path: метод API
+        :param params: параметры запроса
+        :param fields: хешируемые параметры
+        :param parse: разбор ответа
+        :param kwargs: параметры транспорта
+        :return: результат parse, для асинхронного клиента - корутина
+        """
+        raise NotImplementedError
 
-    def __init__(self, login, password):
-        self.login = login
-        self.password = password
-
-    def _handle_error(self, response):
-        super(PaymasterApiClient, self)._handle_error(response)
+    def _check_error_code(self, response, path=None):
+        if path in self.BINARY_CONTENT and 'json' not in response.headers.get('Content-Type', ''):
+            return
         code = response.json()['ErrorCode']
         if code < 0:
             raise PAYMASTER_ERROR_CODES.get(code, ApiError(code=code))
@@ -90,31 +172,23 @@ class PaymasterApiClient(APIClient):
     def _gen_nonce(self):
         return str(uuid4())
 
-    def _calculate_hash(self, data, fields):
+    @cached_property
+    def _signer(self):
         """
         хеш полей запроса. В описании каждого запроса написано, какие поля подлежат хешированию.
         Значения этих полей записываются в одну строчку через точку с запятой,
         затем от полученной UTF8-строки считается SHA1-хеш, который затем кодируется base64.
         PHP код формирования хеша: $hash = base64_encode(sha1($str, true)), где $str - строка параметров
-        :param data:
-        :param fields:
-        :return:
+        Строка всегда начинается с login;password; - эта часть хешируется один раз.
         """
-        _line = u';'.join(map(str, [data.get(key) or '' for key in fields]))
-        _hash = hashlib.sha1(bytes(_line.encode('utf-8')))
-        _hash = base64.b64encode(_hash.digest()).replace('\n', '')
-        return _hash.encode('utf-8')
+        prefix = u'{0};{1};'.format(self.login or '', self.password or '')
+        return Signer(prefix=prefix, hash_method='sha1')
 
     def _auth_params(self, params, fields=None):
-        fields = fields or []
+        fields = ['nonce'] + list(fields or [])
         params['nonce'] = self._gen_nonce()
         params['login'] = self.login
-        fields = ['login', 'password', 'nonce'] + fields
-
-        hash_params = dict(params)
-        hash_params['password'] = self.password
-
-        params['hash'] = self._calculate_hash(hash_params, fields)
+        params['hash'] = self._signer.sign(params, fields)
         return params
 
     def _prepare_payment_data(self, payment_data):
@@ -128,19 +202,99 @@ class PaymasterApiClient(APIClient):
             payment_data['LastUpdate'] = parse_datetime(payment_data['LastUpdate'])
         return payment_data
 
-    def _normalize_date(self, date_obj):
-        if date_obj is None:
-            return date_obj
+    def _prepare_payments(self, payments):
+        """ _prepare_payment_data для списка за один проход """
+        for payment in payments:
+            payment.pop('LastUpdate', None)
+        return parse_datetimes(payments, 'LastUpdateTime')
+
+    def _prepare_refunds(self, refunds):
+        return parse_datetimes(refunds, 'LastUpdate')
 
+    def _to_date(self, date_obj):
         if isinstance(date_obj, str):
             date_obj = parse_datetime(date_obj)
 
         if isinstance(date_obj, datetime.datetime):
             date_obj = date_obj.date()
 
+        return date_obj
+
+    def _normalize_date(self, date_obj):
+        if date_obj is None:
+            return date_obj
+
+        date_obj = self._to_date(date_obj)
+
         if isinstance(date_obj, datetime.date):
             return date_obj.isoformat()
 
+    def _is_overflow(self, result):
+        return result.get('Overflow') in (True, 'true')
+
+    def _split_period(self, period_from, period_to, chunk_days=None):
+        """
+        Разбить период на окна. Соседние окна пересекаются на граничный день,
+        т.к. включительность periodFrom/periodTo в API не определена, дубли отсекаются по ID.
+        Без chunk_days делит период пополам, для окна в один день возвращает пустой список.
+        """
+        days = (period_to - period_from).days
+        if chunk_days is None:
+            if days < 2:
+                return []
+            chunk_days = days // 2 + days % 2
+        windows = []
+        start = period_from
+        while start < period_to:
+            end = min(start + datetime.timedelta(days=chunk_days), period_to)
+            windows.append((start, end))
+            start = end
+        return windows
+
+    def _get_bulk_item(self, _id, merchant_id=None):
+        if merchant_id is None:
+            return self.get_payment(_id)
+        return self.get_payment_by_invoice_id(_id, merchant_id)
+
+    def _parse_payment(self, response):
+        if self.records:
+            return PaymasterPayment.from_api(response.json()['Payment'])
+        return self._prepare_payment_data(response.json()['Payment'])
+
+    def _parse_payments(self, response):
+        result = response.json()['Response']
+        if self.records:
+            result['Payments'] = [PaymasterPayment.from_api(p) for p in result['Payments']]
+        else:
+            result['Payments'] = self._prepare_payments(result['Payments'])
+        return result
+
+    def _parse_refund(self, response):
+        if self.records:
+            return PaymasterRefund.from_api(response.json()['Refund'])
+        return response.json()['Refund']
+
+    def _parse_refunds(self, response):
+        result = response.json()['Response']
+        if self.records:
+            result['Refunds'] = [PaymasterRefund.from_api(r) for r in result['Refunds']]
+        else:
+            result['Refunds'] = self._prepare_refunds(result['Refunds'])
+        return result
+
+    def _parse_documents(self, response):
+        result = response.json()['Response']['Documents']
+        if self.records:
+            return [PaymasterDocument.from_api(d) for d in result]
+        for document in result:
+            created = parse_ms_date(document['Created'] or '')
+            if created is not None:
+                document['Created'] = created
+        return result
+
+    def _parse_document_content(self, response):
+        return response
+
     def get_payment(self, payment_id):
         """
         Проверка статуса по идентификатору платежа
@@ -175,11 +329,8 @@ class PaymasterApiClient(APIClient):
         :param payment_id:
         :return:
         """
-        params = self._auth_params(
-            {'paymentID': payment_id}, ['paymentID']
-        )
-        response = self._get('getPayment', params=params)
-        return self._prepare_payment_data(response.json()['Payment'])
+        params = {'paymentID': payment_id}
+        return self._call('getPayment', params, ['paymentID'], self._parse_payment)
 
     def get_payment_by_invoice_id(self, invoice_id, merchant_id):
         """
@@ -199,9 +350,7 @@ class PaymasterApiClient(APIClient):
             ('invoiceID', invoice_id),
             ('siteAlias', merchant_id),
         ))
-        params = self._auth_params(params, fields=params.keys())
-        response = self._get('getPaymentByInvoiceID', params=params)
-        return self._prepare_payment_data(response.json()['Payment'])
+        return self._call('getPaymentByInvoiceID', params, params.keys(), self._parse_payment)
 
     def get_payments(self,
                      period_from=None,
@@ -244,13 +393,7 @@ class PaymasterApiClient(APIClient):
             ('invoiceID', invoice_id),
             ('state', state)
         ))
-        params = self._auth_params(params, fields=params.keys())
-
-        response = self._get('listPaymentsFilter', params=params)
-
-        result = response.json()['Response']
-        result['Payments'] = map(self._prepare_payment_data, result['Payments'])
-        return result
+        return self._call('listPaymentsFilter', params, params.keys(), self._parse_payments)
 
     def refund_payment(self, payment_id, amount, external_id=None):
         """
@@ -284,11 +427,7 @@ class PaymasterApiClient(APIClient):
             ('amount', amount),
             ('externalID', external_id),
         ))
-        params = self._auth_params(params, fields=params.keys())
-
-        response = self._get('refundPayment', params=params)
-
-        return response.json()['Refund']
+        return self._call('refundPayment', params, params.keys(), self._parse_refund)
 
     def list_refunds(self,
                      period_from=None,
@@ -327,13 +466,7 @@ class PaymasterApiClient(APIClient):
             ('periodTo', self._normalize_date(period_to)),
             ('externalID', external_id),
         ))
-        params = self._auth_params(params, fields=params.keys())
-
-        response = self._get('listRefunds', params=params)
-
-        result = response.json()['Response']
-        result['Refunds'] = map(self._prepare_refund_data, result['Refunds'])
-        return result
+        return self._call('listRefunds', params, params.keys(), self._parse_refunds)
 
     def confirm_payment(self, payment_id, amount=None):
         """
@@ -353,9 +486,7 @@ class PaymasterApiClient(APIClient):
             ('paymentID', payment_id),
             ('amount', amount),
         ))
-        params = self._auth_params(params, fields=params.keys())
-        response = self._get('ConfirmPayment', params=params)
-        return self._prepare_payment_data(response.json()['Payment'])
+        return self._call('ConfirmPayment', params, params.keys(), self._parse_payment)
 
     def cancel_payment(self, payment_id, error=INVOICE_REJECTED):
         """
@@ -376,9 +507,7 @@ class PaymasterApiClient(APIClient):
             ('paymentID', payment_id),
             ('error', error),
         ))
-        params = self._auth_params(params, fields=params.keys())
-        response = self._get('CancelPayment', params=params)
-        return self._prepare_payment_data(response.json()['Payment'])
+        return self._call('CancelPayment', params, params.keys(), self._parse_payment)
 
     def documents(self, account_id=None, period_from=None, period_to=None):
         """
@@ -410,20 +539,9 @@ class PaymasterApiClient(APIClient):
             ('periodFrom', self._normalize_date(period_from)),
             ('periodTo', self._normalize_date(period_to)),
         ))
-        params = self._auth_params(params, fields=params.keys())
-
-        response = self._get('listDocuments', params=params)
+        return self._call('listDocuments', params, params.keys(), self._parse_documents)
 
-        result = response.json()['Response']['Documents']
-        for document in result:
-            try:
-                ts = float(re.findall("/Date\((\d+)\)/", document['Created'])[0]) / 1000
-                document['Created'] = datetime.datetime.fromtimestamp(ts)
-            except (IndexError, ValueError):
-                pass
-        return result
-
-    def fetch_document(self, document_id):
+    def fetch_document(self, document_id, **kwargs):
         """
         Скачивание документа
         Этот запрос используется для скачивания документа по его идентификатору:
@@ -433,11 +551,288 @@ class PaymasterApiClient(APIClient):
          Хешируемые параметры:
             login;password;nonce;documentID
         :param document_id:
-        :return: instance of requests.Response
+        :return: instance of requests.Response (httpx.Response for async client)
         """
         params = OrderedDict((
             ('documentID', document_id),
         ))
-        params = self._auth_params(params, fields=params.keys())
-        response = self._get('getDocumentContent', params=params)
-        return response
+        return self._call('getDocumentContent', params, params.keys(),
+                          self._parse_document_content, **kwargs)
+
+
+class PaymasterApiClient(BasePaymasterApiClient, APIClient):
+    def __init__(self, login, password, session=None, timeout=None, endpoint=None, cache=None,
+                 throttle=None, retry=None, circuit_breaker=None, metrics=None, records=None):
+        """
+        :param cache: экземпляр rest_api.cache.PaymentCache для результатов getPayment
+        :param throttle: общий ограничитель запросов rest_api.throttling.Throttle
+        :param retry: rest_api.retry.RetryPolicy, по умолчанию без повторов
+        :param circuit_breaker: общий для процесса rest_api.retry.CircuitBreaker
+        :param metrics: бэкенд metrics.BaseMetrics для длительности вызовов и повторов
+        :param records: возвращать PaymasterPayment, PaymasterRefund и PaymasterDocument
+        """
+        super(PaymasterApiClient, self).__init__(session=session, timeout=timeout,
+                                                 endpoint=endpoint, throttle=throttle)
+        self.login = login
+        self.password = password
+        self.cache = cache
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.metrics = metrics or NULL_METRICS
+        if records is not None:
+            self.records = records
+
+    def _handle_error(self, response, path=None):
+        super(PaymasterApiClient, self)._handle_error(response, path)
+        self._check_error_code(response, path)
+
+    def _is_overload(self, error):
+        return isinstance(error, PaymasterNetworkError) or super(
+            PaymasterApiClient, self)._is_overload(error)
+
+    def _is_transient(self, error):
+        return self._is_overload(error) or isinstance(
+            error, (PaymentSystemNetworkError, PaymentSystemDisabled))
+
+    def _should_retry(self, path, error, attempt):
+        if self.retry is None or attempt >= self.retry.retries or not self._is_transient(error):
+            return False
+        if path in self.NON_IDEMPOTENT:
+            # повторяем, только если запрос не был отправлен: ошибка API (-2, -5, -24)
+            # может прийти уже после выполнения, а externalID не проверяется на уникальность
+            return isinstance(error, requests.ConnectTimeout)
+        return True
+
+    def _call(self, path, params, fields, parse, **kwargs):
+        with self.metrics.timer('api_request', endpoint=path, outcome='ok') as tags:
+            try:
+                return self._call_with_retries(path, params, fields, parse, **kwargs)
+            except Exception as e:
+                tags['outcome'] = type(e).__name__
+                raise
+
+    def _call_with_retries(self, path, params, fields, parse, **kwargs):
+        fields = list(fields)
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None and not self.circuit_breaker.allow():
+                raise PaymasterUnavailable()
+            try:
+                # новый nonce на каждую попытку, повтор с потраченным отклоняется
+                response = self._get(path, params=self._auth_params(dict(params), fields),
+                                     **kwargs)
+            except Exception as e:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(failed=self._is_overload(e))
+                if not self._should_retry(path, e, attempt):
+                    raise
+                attempt += 1
+                self.metrics.increment('api_retry', endpoint=path)
+                delay = self.retry.sleep(attempt)
+                logger.warning('%s failed: %s, retry %s after %.2fs', path, e, attempt, delay)
+                continue
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.record(failed=False)
+            return parse(response)
+
+    def get_payment(self, payment_id):
+        if self.cache is None:
+            return super(PaymasterApiClient, self).get_payment(payment_id)
+        payment = self.cache.get_payment(payment_id)
+        if payment is None:
+            payment = super(PaymasterApiClient, self).get_payment(payment_id)
+            self.cache.set_payment(payment)
+        return payment
+
+    def get_payment_by_invoice_id(self, invoice_id, merchant_id):
+        if self.cache is None:
+            return super(PaymasterApiClient, self).get_payment_by_invoice_id(
+                invoice_id, merchant_id)
+        payment = self.cache.get_payment_by_invoice_id(invoice_id, merchant_id)
+        if payment is None:
+            payment = super(PaymasterApiClient, self).get_payment_by_invoice_id(
+                invoice_id, merchant_id)
+            self.cache.set_payment(payment, invoice_id=invoice_id, merchant_id=merchant_id)
+        return payment
+
+    def invalidate(self, payment_id):
+        """ Сбросить кеш платежа """
+        if self.cache is not None:
+            self.cache.invalidate(payment_id)
+
+    def refund_payment(self, payment_id, amount, external_id=None):
+        try:
+            return super(PaymasterApiClient, self).refund_payment(payment_id, amount, external_id)
+        finally:
+            self.invalidate(payment_id)
+
+    def confirm_payment(self, payment_id, amount=None):
+        try:
+            return super(PaymasterApiClient, self).confirm_payment(payment_id, amount)
+        finally:
+            self.invalidate(payment_id)
+
+    def cancel_payment(self, payment_id, error=INVOICE_REJECTED):
+        try:
+            return super(PaymasterApiClient, self).cancel_payment(payment_id, error)
+        finally:
+            self.invalidate(payment_id)
+
+    def get_payments_bulk(self, ids, merchant_id=None, max_concurrency=settings.API_POOL_SIZE):
+        """
+        Параллельная проверка статусов пачки платежей через getPayment/getPaymentByInvoiceID.
+        Ошибка по одному платежу не прерывает обработку остальных.
+
+        :param ids: идентификаторы платежей (LMI_SYS_PAYMENT_ID),
+            или номера счетов (LMI_PAYMENT_NO), если указан merchant_id
+        :param merchant_id: идентификатор сайта (LMI_MERCHANT_ID) для поиска по номеру счета
+        :param max_concurrency: число одновременных запросов, не больше размера пула соединений
+        :return: генератор пар (id, платеж или исключение) в порядке получения ответов
+        """
+        def fetch(_id):
+            return self._get_bulk_item(_id, merchant_id)
+
+        for _id, future in imap_unordered(fetch, ids, max_concurrency):
+            try:
+                yield _id, future.result()
+            except (BaseApiError, requests.RequestException) as e:
+                yield _id, e
+
+    def _iter_period(self, fetch, items_key, key, period_from, period_to,
+                     chunk_days=None, max_concurrency=1):
+        """
+        Обход периода окнами: окно с Overflow делится пополам и запрашивается заново.
+        :param fetch: функция запроса окна fetch(period_from, period_to)
+        :param items_key: ключ списка записей в ответе
+        :param key: функция идентификатора записи для отсечения дублей
+        """
+        period_from = self._to_date(period_from)
+        if period_to is None:
+            period_to = datetime.datetime.utcnow().date() + datetime.timedelta(days=1)
+        period_to = self._to_date(period_to)
+
+        # без chunk_days период делится, только если API вернул Overflow
+        windows = [(period_from, period_to)]
+        if chunk_days is not None:
+            windows = self._split_period(period_from, period_to, chunk_days) or windows
+        seen = set()
+        while windows:
+            overflowed = []
+            for window, future in imap_unordered(lambda w: fetch(*w), windows, max_concurrency):
+                result = future.result()
+                if self._is_overflow(result):
+                    halves = self._split_period(*window)
+                    if halves:
+                        overflowed.extend(halves)
+                        continue
+                    logger.warning('%s for %s - %s is truncated by Overflow', items_key, *window)
+                for item in result[items_key]:
+                    item_key = key(item)
+                    if item_key not in seen:
+                        seen.add(item_key)
+                        yield item
+            windows = overflowed
+
+    def iter_payments(self, period_from, period_to=None, invoice_id=None, state=None,
+                      account_id=None, merchant_id=None, chunk_days=None, max_concurrency=1):
+        """
+        Все платежи за период через listPaymentsFilter без ограничения Overflow.
+        Окна, для которых API вернул Overflow, рекурсивно делятся пополам,
+        платежи отдаются по мере получения без повторов по PaymentID.
+
+        :param period_from: начало периода
+        :param period_to: конец периода, по умолчанию завтрашний день UTC
+        :param chunk_days: сразу разбить период на окна такого размера
+        :param max_concurrency: число одновременных запросов окон
+        :return: генератор платежей
+        """
+        def fetch(window_from, window_to):
+            return self.get_payments(period_from=window_from, period_to=window_to,
+                                     invoice_id=invoice_id, state=state,
+                                     account_id=account_id, merchant_id=merchant_id)
+
+        return self._iter_period(fetch, 'Payments', itemgetter('PaymentID'),
+                                 period_from, period_to,
+                                 chunk_days=chunk_days, max_concurrency=max_concurrency)
+
+    def _refund_key(self, refund):
+        # API не описывает собственный идентификатор возврата
+        return refund.get('RefundID') or (
+            refund['PaymentID'], refund.get('ExternalID'),
+            refund.get('Amount'), refund.get('LastUpdate'),
+        )
+
+    def iter_refunds(self, period_from, period_to=None, payment_id=None, account_id=None,
+                     external_id=None, chunk_days=None, max_concurrency=1):
+        """
+        Все возвраты за период через listRefunds без ограничения Overflow.
+        Аналогично iter_payments: окна с Overflow делятся пополам,
+        возвраты отдаются по мере получения без повторов.
+
+        :param period_from: начало периода
+        :param period_to: конец периода, по умолчанию завтрашний день UTC
+        :param chunk_days: сразу разбить период на окна такого размера
+        :param max_concurrency: число одновременных запросов окон
+        :return: генератор возвратов
+        """
+        def fetch(window_from, window_to):
+            return self.list_refunds(period_from=window_from, period_to=window_to,
+                                     payment_id=payment_id, account_id=account_id,
+                                     external_id=external_id)
+
+        return self._iter_period(fetch, 'Refunds', self._refund_key, period_from, period_to,
+                                 chunk_days=chunk_days, max_concurrency=max_concurrency)
+
+    def fetch_document(self, document_id, destination=None, stream=False,
+                       chunk_size=settings.API_DOCUMENT_CHUNK_SIZE):
+        """
+        Скачивание документа, см. BasePaymasterApiClient.fetch_document
+
+        :param document_id:
+        :param destination: путь или файловый объект, куда документ записывается по частям
+        :param stream: не загружать содержимое в память, читать через response.iter_content
+        :param chunk_size: размер части при записи в destination
+        :return: requests.Response, если destination не указан, иначе destination
+        """
+        response = super(PaymasterApiClient, self).fetch_document(
+            document_id, stream=stream or destination is not None)
+        if destination is None:
+            return response
+
+        with response:
+            if isinstance(destination, (str, os.PathLike)):
+                with open(destination, 'wb') as f:
+                    self._write_content(response, f, chunk_size)
+            else:
+                self._write_content(response, destination, chunk_size)
+        return destination
+
+    def _write_content(self, response, fileobj, chunk_size):
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            fileobj.write(chunk)
+
+    def fetch_documents(self, documents, directory, max_concurrency=settings.API_POOL_SIZE,
+                        chunk_size=settings.API_DOCUMENT_CHUNK_SIZE):
+        """
+        Параллельное скачивание документов в каталог, каждый документ пишется на диск по частям.
+
+        :param documents: результат documents() или идентификаторы документов
+        :param directory: каталог для сохранения, имя файла - "<DocumentID>-<FileName>"
+        :param max_concurrency: число одновременных загрузок
+        :return: генератор пар (документ, путь к файлу или исключение) в порядке завершения
+        """
+        def fetch(document):
+            if isinstance(document, (dict, PaymasterDocument)):
+                document_id = document['DocumentID']
+                file_name = '{0}-{1}'.format(
+                    document_id, os.path.basename(document.get('FileName') or ''))
+            else:
+                document_id = file_name = str(document)
+            path = os.path.join(directory, file_name)
+            return self.fetch_document(document_id, destination=path, chunk_size=chunk_size)
+
+        for document, future in imap_unordered(fetch, documents, max_concurrency):
+            try:
+                yield document, future.result()
+            except (BaseApiError, requests.RequestException, OSError) as e:
+                yield document, e
@@ -21,6 +21,10 @@ class PaymasterNetworkError(ApiError):
     code = -2
 
 
+class PaymentSystemNetworkError(ApiError):
+    code = -5
+
+
 class PaymasterPermissionError(ApiError):
     code = -6
 
@@ -41,14 +45,26 @@ class IncorrectAmountValue(ApiError):
     code = -18
 
 
+class PaymentSystemDisabled(ApiError):
+    code = -24
+
+
+class PaymasterUnavailable(ApiError):
+    """ Запрос не выполнялся: API недоступен по данным CircuitBreaker """
+    code = None
+    message = 'Paymaster API временно недоступен'
+
+
 PAYMASTER_ERROR_CODES = {e.code: e for e in
                          [
                              ApiError,
                              PaymasterNetworkError,
+                             PaymentSystemNetworkError,
                              PaymasterPermissionError,
                              SignError,
                              PaymentNotFound,
                              DuplicateNonce,
-                             IncorrectAmountValue
+                             IncorrectAmountValue,
+                             PaymentSystemDisabled,
                          ]
                          }
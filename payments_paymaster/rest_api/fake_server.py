@@ -0,0 +1,288 @@
+"""
+Local stand-in of the Paymaster REST API for load and latency testing:
+
+    server = FakePaymasterServer('login', 'password', latency=0.05)
+    server.populate(1000)
+    with serve(server) as endpoint:
+        client = PaymasterApiClient('login', 'password', endpoint=endpoint)
+        client.get_payment(1)
+"""
+import contextlib
+import datetime
+import json
+import random
+import socketserver
+import threading
+import time
+from decimal import Decimal
+from urllib.parse import parse_qsl
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from ..utils import Signer
+
+HASH_FIELDS = {
+    'getPayment': ['paymentID'],
+    'getPaymentByInvoiceID': ['invoiceID', 'siteAlias'],
+    'listPaymentsFilter': ['accountID', 'siteAlias', 'periodFrom', 'periodTo',
+                           'invoiceID', 'state'],
+    'refundPayment': ['paymentID', 'amount', 'externalID'],
+    'listRefunds': ['accountID', 'paymentID', 'periodFrom', 'periodTo', 'externalID'],
+    'ConfirmPayment': ['paymentID', 'amount'],
+    'CancelPayment': ['paymentID', 'error'],
+    'listDocuments': ['accountID', 'periodFrom', 'periodTo'],
+    'getDocumentContent': ['documentID'],
+}
+
+
+class ApiErrorResponse(Exception):
+    def __init__(self, code):
+        self.code = code
+
+
+def _ms_date(dt):
+    return '/Date({0})/'.format(int(dt.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000))
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class FakePaymasterServer(object):
+    """
+    WSGI приложение с методами REST API, подписью запросов и хранением данных в памяти.
+
+    :param latency: задержка ответа в секундах
+    :param error_rate: доля ответов с ошибкой: HTTP 503 или ErrorCode -5
+    :param list_limit: максимум записей в списке, больше - Overflow
+    :param site_id: SiteID платежей, числовой идентификатор сайта, не совпадает с merchant_id
+    """
+
+    def __init__(self, login, password, merchant_id='merchant', latency=0, error_rate=0,
+                 list_limit=1000, seed=None, site_id=1001):
+        self.login = login
+        self.merchant_id = merchant_id
+        self.site_id = site_id
+        self.latency = latency
+        self.error_rate = error_rate
+        self.list_limit = list_limit
+        self.signer = Signer(prefix=u'{0};{1};'.format(login, password), hash_method='sha1')
+
+        self.payments = {}
+        self.refunds = []
+        self.documents = {}
+        self._nonces = set()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+
+    def add_payment(self, payment_id, invoice_id=None, amount='100.00', state='COMPLETE',
+                    updated=None):
+        updated = updated or datetime.datetime.utcnow().replace(microsecond=0)
+        payment = {
+            'PaymentID': payment_id,
+            'SiteInvoiceID': invoice_id or str(payment_id),
+            'SiteID': self.site_id,
+            'State': state,
+            'Amount': float(amount),
+            'CurrencyCode': 'RUB',
+            'PaymentAmount': float(amount),
+            'PaymentCurrencyCode': 'RUB',
+            'IsTestPayment': True,
+            'PaymentSystemID': 3,
+            'Purpose': 'Payment',
+            'UserIdentifier': None,
+            'UserPhoneNumber': None,
+            'LastUpdate': _ms_date(updated),
+            'LastUpdateTime': updated.isoformat(),
+        }
+        self.payments[payment_id] = payment
+        return payment
+
+    def add_document(self, document_id, content, file_name='document.xls', created=None):
+        created = created or datetime.datetime.utcnow().replace(microsecond=0)
+        self.documents[document_id] = ({
+            'DocumentID': document_id,
+            'FileName': file_name,
+            'Description': file_name,
+            'Created': _ms_date(created),
+        }, content)
+
+    def populate(self, count, start=None, days=30):
+        """ Заполнить count платежей, равномерно распределенных по days дням от start """
+        start = start or datetime.datetime.utcnow().replace(microsecond=0) - datetime.timedelta(
+            days=days)
+        step = datetime.timedelta(days=days) / max(count, 1)
+        states = ['COMPLETE', 'COMPLETE', 'COMPLETE', 'CANCELLED', 'PROCESSING']
+        for i in range(1, count + 1):
+            self.add_payment(i, invoice_id='invoice-{0}'.format(i),
+                             state=states[i % len(states)],
+                             updated=(start + step * i).replace(microsecond=0))
+
+    def __call__(self, environ, start_response):
+        if self.latency:
+            time.sleep(self.latency)
+
+        path = environ.get('PATH_INFO', '').rstrip('/').rsplit('/', 1)[-1]
+        params = dict(parse_qsl(environ.get('QUERY_STRING', '')))
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            if self._random.random() < 0.5:
+                start_response('503 Service Unavailable', [('Content-Type', 'text/plain')])
+                return [b'Service Unavailable']
+            return self._json(start_response, {'ErrorCode': -5})
+
+        handler = getattr(self, 'do_' + path, None)
+        if handler is None:
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+
+        try:
+            self._check_auth(path, params)
+            result = handler(params)
+        except ApiErrorResponse as e:
+            return self._json(start_response, {'ErrorCode': e.code})
+
+        if isinstance(result, bytes):
+            start_response('200 OK', [('Content-Type', 'application/octet-stream'),
+                                      ('Content-Length', str(len(result)))])
+            return [result]
+        result['ErrorCode'] = 0
+        return self._json(start_response, result)
+
+    def _json(self, start_response, payload):
+        body = json.dumps(payload).encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'application/json; charset=utf-8'),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+
+    def _check_auth(self, path, params):
+        if params.get('login') != self.login:
+            raise ApiErrorResponse(-6)
+        if not self.signer.verify(params, params.get('hash'), ['nonce'] + HASH_FIELDS[path]):
+            raise ApiErrorResponse(-7)
+        with self._lock:
+            if params['nonce'] in self._nonces:
+                raise ApiErrorResponse(-14)
+            self._nonces.add(params['nonce'])
+
+    def _get_payment(self, payment_id):
+        try:
+            return self.payments[int(payment_id)]
+        except (KeyError, ValueError):
+            raise ApiErrorResponse(-13)
+
+    def _in_period(self, value, params):
+        period_from = _parse_date(params.get('periodFrom'))
+        period_to = _parse_date(params.get('periodTo'))
+        day = datetime.datetime.strptime(value[:10], '%Y-%m-%d').date()
+        return (period_from is None or day >= period_from) and (
+            period_to is None or day <= period_to)
+
+    def _limited(self, items):
+        return {
+            'Overflow': len(items) > self.list_limit,
+            'Items': items[:self.list_limit],
+        }
+
+    def do_getPayment(self, params):
+        return {'Payment': dict(self._get_payment(params.get('paymentID')))}
+
+    def do_getPaymentByInvoiceID(self, params):
+        for payment in self.payments.values():
+            if payment['SiteInvoiceID'] == params.get('invoiceID'):
+                return {'Payment': dict(payment)}
+        raise ApiErrorResponse(-13)
+
+    def do_listPaymentsFilter(self, params):
+        payments = [
+            dict(p) for p in self.payments.values() if all((
+                self._in_period(p['LastUpdateTime'], params),
+                params.get('invoiceID') in (None, p['SiteInvoiceID']),
+                params.get('state') in (None, p['State']),
+            ))
+        ]
+        result = self._limited(payments)
+        return {'Response': {'Overflow': result['Overflow'], 'Payments': result['Items']}}
+
+    def do_refundPayment(self, params):
+        payment = self._get_payment(params.get('paymentID'))
+        amount = Decimal(params.get('amount') or 0)
+        if amount <= 0:
+            raise ApiErrorResponse(-18)
+        if amount > Decimal(str(payment['Amount'])):
+            raise ApiErrorResponse(-12)
+        refund = {
+            'RefundID': len(self.refunds) + 1,
+            'PaymentID': payment['PaymentID'],
+            'ExternalID': params.get('externalID'),
+            'Status': 'SUCCESS',
+            'Amount': float(amount),
+            'LastUpdate': datetime.datetime.utcnow().replace(microsecond=0).isoformat(),
+        }
+        with self._lock:
+            self.refunds.append(refund)
+        return {'Refund': dict(refund)}
+
+    def do_listRefunds(self, params):
+        refunds = [
+            dict(r) for r in self.refunds if all((
+                self._in_period(r['LastUpdate'], params),
+                params.get('paymentID') in (None, str(r['PaymentID'])),
+                params.get('externalID') in (None, r['ExternalID']),
+            ))
+        ]
+        result = self._limited(refunds)
+        return {'Response': {'Overflow': result['Overflow'], 'Refunds': result['Items']}}
+
+    def _set_state(self, params, state):
+        payment = self._get_payment(params.get('paymentID'))
+        updated = datetime.datetime.utcnow().replace(microsecond=0)
+        payment.update({
+            'State': state,
+            'LastUpdate': _ms_date(updated),
+            'LastUpdateTime': updated.isoformat(),
+        })
+        return {'Payment': dict(payment)}
+
+    def do_ConfirmPayment(self, params):
+        return self._set_state(params, 'COMPLETE')
+
+    def do_CancelPayment(self, params):
+        return self._set_state(params, 'CANCELLED')
+
+    def do_listDocuments(self, params):
+        return {'Response': {'Documents': [dict(meta) for meta, _ in self.documents.values()]}}
+
+    def do_getDocumentContent(self, params):
+        try:
+            return self.documents[int(params.get('documentID'))][1]
+        except (KeyError, ValueError):
+            raise ApiErrorResponse(-13)
+
+
+class _ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve(app, host='127.0.0.1', port=0):
+    """
+    Запустить WSGI приложение в фоновом потоке
+    :return: endpoint для PaymasterApiClient
+    """
+    server = make_server(host, port, app, server_class=_ThreadingWSGIServer,
+                         handler_class=_QuietRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05},
+                              daemon=True)
+    thread.start()
+    try:
+        yield 'http://{0}:{1}/partners/rest/'.format(*server.server_address[:2])
+    finally:
+        server.shutdown()
+        server.server_close()
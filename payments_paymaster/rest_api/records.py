@@ -0,0 +1,170 @@
+"""
+Компактные записи ответов API вместо dict, включаются параметром клиента records=True.
+
+Поля хранятся в __slots__, суммы и даты остаются в виде из json
+и преобразуются в Decimal и datetime при первом обращении.
+Доступ по ключам API оставлен для совместимости с dict: payment['State'], payment.get('Amount').
+Ключи, не описанные в FIELDS, отбрасываются. Строки полей с малым числом значений
+(состояние, валюта, сайт) интернируются, чтобы не хранить копию в каждой записи.
+"""
+from datetime import datetime
+from decimal import Decimal
+from sys import intern as _intern
+
+from ..utils import parse_datetime
+
+
+def _to_decimal(value):
+    return Decimal(str(value))
+
+
+class LazyField(object):
+    """ Поле, преобразуемое convert при первом чтении, значение хранится в слоте slot """
+
+    def __init__(self, slot, convert, type_):
+        self.slot = slot
+        self.convert = convert
+        self.type = type_
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = getattr(instance, self.slot)
+        if value is None or value == '' or isinstance(value, self.type):
+            return value
+        value = self.convert(value)
+        setattr(instance, self.slot, value)
+        return value
+
+    def __set__(self, instance, value):
+        setattr(instance, self.slot, value)
+
+
+def decimal_field(slot):
+    return LazyField(slot, _to_decimal, Decimal)
+
+
+def datetime_field(slot):
+    return LazyField(slot, parse_datetime, datetime)
+
+
+class Record(object):
+    """
+    Базовая запись. FIELDS - пары (ключ API, атрибут),
+    для ленивых полей атрибут - LazyField, значение хранится в слоте "_<атрибут>".
+    INTERNED - ключи API, строковые значения которых интернируются
+    """
+    __slots__ = ()
+    FIELDS = ()
+    INTERNED = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._key_attrs = dict(cls.FIELDS)
+        # ленивые поля копируются через слоты, без преобразования
+        cls._slot_fields = tuple(
+            (key, getattr(cls, attr).slot if isinstance(getattr(cls, attr, None), LazyField)
+             else attr)
+            for key, attr in cls.FIELDS)
+        cls._load_fields = tuple((key, attr, key in cls.INTERNED)
+                                 for key, attr in cls._slot_fields)
+
+    def __init__(self, **kwargs):
+        for _, attr in self.FIELDS:
+            setattr(self, attr, kwargs.get(attr))
+
+    @classmethod
+    def from_api(cls, data):
+        record = cls.__new__(cls)
+        get = data.get
+        for key, attr, interned in cls._load_fields:
+            value = get(key)
+            if interned and type(value) is str:
+                value = _intern(value)
+            setattr(record, attr, value)
+        return record
+
+    def __getitem__(self, key):
+        return getattr(self, self._key_attrs[key])
+
+    def get(self, key, default=None):
+        attr = self._key_attrs.get(key)
+        return default if attr is None else getattr(self, attr)
+
+    def to_dict(self):
+        """ dict с ключами API и преобразованными значениями """
+        return {key: getattr(self, attr) for key, attr in self.FIELDS}
+
+    def copy(self):
+        record = type(self).__new__(type(self))
+        for _, attr in self._slot_fields:
+            setattr(record, attr, getattr(self, attr))
+        return record
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __getstate__(self):
+        return [getattr(self, attr) for _, attr in self._slot_fields]
+
+    def __setstate__(self, state):
+        for (_, attr), value in zip(self._slot_fields, state):
+            setattr(self, attr, value)
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(type(self).__name__, getattr(self, self.FIELDS[0][1]))
+
+
+class PaymasterPayment(Record):
+    __slots__ = (
+        'payment_id', 'site_invoice_id', 'site_id', 'state', '_amount', 'currency_code',
+        '_payment_amount', 'payment_currency_code', 'is_test_payment', 'payment_system_id',
+        'purpose', 'user_identifier', 'user_phone_number', '_last_update_time',
+    )
+    FIELDS = (
+        ('PaymentID', 'payment_id'),
+        ('SiteInvoiceID', 'site_invoice_id'),
+        ('SiteID', 'site_id'),
+        ('State', 'state'),
+        ('Amount', 'amount'),
+        ('CurrencyCode', 'currency_code'),
+        ('PaymentAmount', 'payment_amount'),
+        ('PaymentCurrencyCode', 'payment_currency_code'),
+        ('IsTestPayment', 'is_test_payment'),
+        ('PaymentSystemID', 'payment_system_id'),
+        ('Purpose', 'purpose'),
+        ('UserIdentifier', 'user_identifier'),
+        ('UserPhoneNumber', 'user_phone_number'),
+        ('LastUpdateTime', 'last_update_time'),
+    )
+    INTERNED = ('SiteID', 'State', 'CurrencyCode', 'PaymentCurrencyCode')
+    amount = decimal_field('_amount')
+    payment_amount = decimal_field('_payment_amount')
+    last_update_time = datetime_field('_last_update_time')
+
+
+class PaymasterRefund(Record):
+    __slots__ = ('refund_id', 'payment_id', 'external_id', 'status', '_amount',
+                 '_last_update')
+    FIELDS = (
+        ('RefundID', 'refund_id'),
+        ('PaymentID', 'payment_id'),
+        ('ExternalID', 'external_id'),
+        ('Status', 'status'),
+        ('Amount', 'amount'),
+        ('LastUpdate', 'last_update'),
+    )
+    INTERNED = ('Status',)
+    amount = decimal_field('_amount')
+    last_update = datetime_field('_last_update')
+
+
+class PaymasterDocument(Record):
+    __slots__ = ('document_id', 'file_name', 'description', '_created')
+    FIELDS = (
+        ('DocumentID', 'document_id'),
+        ('FileName', 'file_name'),
+        ('Description', 'description'),
+        ('Created', 'created'),
+    )
+    created = datetime_field('_created')
@@ -0,0 +1,89 @@
+import os
+import random
+import threading
+import time
+
+from .. import settings
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class RetryPolicy(object):
+    """
+    Повтор временных ошибок с экспоненциальной задержкой и полным джиттером:
+    перед попыткой n ждем случайное время от 0 до min(max_backoff, backoff * 2 ** (n - 1)).
+    """
+
+    def __init__(self, retries=settings.API_RETRIES, backoff=settings.API_RETRY_BACKOFF,
+                 max_backoff=settings.API_RETRY_MAX_BACKOFF):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def get_delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def sleep(self, attempt):
+        delay = self.get_delay(attempt)
+        time.sleep(delay)
+        return delay
+
+
+class CircuitBreaker(object):
+    """
+    После failure_threshold отказов подряд запросы не выполняются recovery_timeout секунд.
+    Затем пропускается один пробный запрос: успех закрывает цепь, отказ открывает снова.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=settings.API_CIRCUIT_FAILURES,
+                 recovery_timeout=settings.API_CIRCUIT_RECOVERY):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """ Можно ли выполнить запрос """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and (
+                    time.monotonic() - self._opened_at >= self.recovery_timeout):
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record(self, failed):
+        with self._lock:
+            if not failed:
+                self.state = self.CLOSED
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def get_circuit_breaker(endpoint, failure_threshold=settings.API_CIRCUIT_FAILURES,
+                        recovery_timeout=settings.API_CIRCUIT_RECOVERY):
+    """
+    Общий на процесс предохранитель для endpoint, аналогично get_session.
+    :return: CircuitBreaker или None, если failure_threshold не задан
+    """
+    if not failure_threshold:
+        return None
+    key = (os.getpid(), endpoint, failure_threshold, recovery_timeout)
+    breaker = _breakers.get(key)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(key)
+            if breaker is None:
+                breaker = _breakers[key] = CircuitBreaker(failure_threshold, recovery_timeout)
+    return breaker
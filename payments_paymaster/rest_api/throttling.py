@@ -0,0 +1,160 @@
+import contextlib
+import os
+import threading
+import time
+
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+class TokenBucket(object):
+    """
+    Ограничение частоты запросов: rate запросов в секунду, не больше burst подряд.
+    Токен резервируется сразу, поэтому ожидающие потоки обслуживаются по очереди.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """ Взять токен, :return: сколько секунд подождать до его появления """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0, -self._tokens / self.rate)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class AdaptiveConcurrencyLimiter(object):
+    """
+    Ограничение числа одновременных запросов по схеме AIMD:
+    успешный запрос увеличивает лимит на 1/limit, перегрузка делит его на backoff_ratio.
+    """
+
+    def __init__(self, max_limit, min_limit=1, initial_limit=None, backoff_ratio=0.5):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial_limit or max_limit)
+        self.backoff_ratio = backoff_ratio
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """ Дождаться свободного места, :return: время ожидания в секундах """
+        started = None
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                started = started or time.monotonic()
+                self._condition.wait()
+            self.in_flight += 1
+        return time.monotonic() - started if started else 0
+
+    def release(self, overloaded=False):
+        with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class ThrottleSlot(object):
+    """ Место для одного запроса, overloaded выставляется при признаках перегрузки API """
+
+    def __init__(self, queued):
+        self.queued = queued
+        self.overloaded = False
+
+
+class Throttle(object):
+    """
+    Ограничитель запросов к API, общий для потоков процесса:
+
+        with throttle.slot() as slot:
+            ...
+            slot.overloaded = True  # 5xx, таймаут, PaymasterNetworkError
+
+    :param rate: запросов в секунду, None - без ограничения
+    :param burst: размер пачки запросов без ожидания, по умолчанию rate
+    :param max_concurrency: верхняя граница адаптивного лимита одновременных запросов,
+        None - без ограничения
+    """
+
+    def __init__(self, rate=None, burst=None, max_concurrency=None):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.limiter = AdaptiveConcurrencyLimiter(max_concurrency) if max_concurrency else None
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.requests = 0
+            self.queued_requests = 0
+            self.overloads = 0
+            self.queued_time = 0.0
+            self.max_queued_time = 0.0
+
+    @property
+    def stats(self):
+        """ Счетчики запросов и времени ожидания в очереди, секунды """
+        with self._stats_lock:
+            return {
+                'requests': self.requests,
+                'queued_requests': self.queued_requests,
+                'overloads': self.overloads,
+                'queued_time': self.queued_time,
+                'max_queued_time': self.max_queued_time,
+                'concurrency_limit': int(self.limiter.limit) if self.limiter else None,
+            }
+
+    def _record(self, queued, overloaded):
+        with self._stats_lock:
+            self.requests += 1
+            self.queued_requests += queued > 0
+            self.overloads += overloaded
+            self.queued_time += queued
+            self.max_queued_time = max(self.max_queued_time, queued)
+
+    @contextlib.contextmanager
+    def slot(self):
+        queued = self.limiter.acquire() if self.limiter else 0
+        slot = None
+        try:
+            if self.bucket:
+                queued += self.bucket.acquire()
+            slot = ThrottleSlot(queued)
+            yield slot
+        finally:
+            overloaded = slot is not None and slot.overloaded
+            if self.limiter:
+                self.limiter.release(overloaded)
+            self._record(queued, overloaded)
+
+
+def get_throttle(rate=None, burst=None, max_concurrency=None):
+    """
+    Общий на процесс ограничитель для заданных настроек, аналогично get_session.
+    :return: Throttle или None, если ограничения не заданы
+    """
+    if not rate and not max_concurrency:
+        return None
+    key = (os.getpid(), rate, burst, max_concurrency)
+    throttle = _throttles.get(key)
+    if throttle is None:
+        with _throttles_lock:
+            throttle = _throttles.get(key)
+            if throttle is None:
+                throttle = _throttles[key] = Throttle(rate, burst, max_concurrency)
+    return throttle
@@ -12,7 +12,72 @@ HASH_FIELDS = (
 )
 
 HASH_METHOD = 'md5'
+
+# Notification fields kept in storage, None keeps all posted fields as before
+NOTIFICATION_FIELDS = None
+# Whitelist for notification_fields: signed fields, signature and payer fields
+COMPACT_NOTIFICATION_FIELDS = HASH_FIELDS + (
+    'LMI_HASH',
+    'LMI_PAYER_IDENTIFIER',
+    'LMI_PAYER_COUNTRY',
+    'LMI_PAYER_IP_ADDRESS',
+)
+# zlib + base64, pays off for long payloads, e.g. with NOTIFICATION_FIELDS = None
+NOTIFICATION_COMPRESS = False
+# Where to keep notifications: 'payment' - payment.extra_data,
+# 'model' - append-only PaymasterNotification table, payment row stays small
+NOTIFICATION_STORAGE = 'payment'
 HASH_FAIL_HTTP_CODE = 200
 
+# How to answer browser returns while the payment is still waiting for notification.
+# 'poll' - lightweight page polling json status, 'refresh' - empty page with Refresh header
+WAITING_MODE = 'poll'
+# Seconds between status checks
+WAITING_POLL_INTERVAL = 3
+WAITING_TEMPLATE = 'payments_paymaster/waiting.html'
+
+# Notification verification through API: 'sync' - in notification request,
+# 'deferred' - acknowledge notification and verify in VERIFICATION_BACKEND
+API_VERIFY_MODE = 'sync'
+# In-process queue, checks are lost on restart: run paymaster_reconcile to recover
+VERIFICATION_BACKEND = 'payments_paymaster.verification.ThreadVerificationBackend'
+VERIFICATION_MAX_ATTEMPTS = 5
+# Seconds before the second attempt, doubles on each next one
+VERIFICATION_BACKOFF = 2
+# Threads of ThreadVerificationBackend
+VERIFICATION_WORKERS = 4
 
+# REST API connection settings
+# Seconds, passed to requests as timeout, (connect, read) tuple is accepted too
+API_TIMEOUT = 10
+# Max keep-alive connections per host
+API_POOL_SIZE = 10
+# Retries of failed connections
+API_MAX_RETRIES = 2
+# Client side limits shared by threads of a process, None disables:
+# requests per second and burst of the token bucket
+API_RATE_LIMIT = None
+API_RATE_BURST = None
+# Upper bound of adaptive concurrency, lowered on 5xx, timeouts and PaymasterNetworkError
+API_MAX_CONCURRENCY = None
+# Retries of transient failures of API calls (connection errors, timeouts, 5xx,
+# ErrorCode -2, -5, -24), each with a new nonce. Seconds before the first retry
+# grow twice per attempt up to the max, the actual delay is random below it
+API_RETRIES = 2
+API_RETRY_BACKOFF = 0.5
+API_RETRY_MAX_BACKOFF = 5
+# Circuit breaker: failures in a row to stop calling the API, None disables,
+# and seconds before a trial call
+API_CIRCUIT_FAILURES = 5
+API_CIRCUIT_RECOVERY = 30
+# Bytes per chunk when streaming documents to disk
+API_DOCUMENT_CHUNK_SIZE = 64 * 1024
+# getPayment cache, seconds for INITIATED/PROCESSING and for COMPLETE/CANCELLED payments
+API_CACHE_TTL = 2
+API_CACHE_FINAL_TTL = 300
+# Max payments in LocMemPaymentCache
+API_CACHE_SIZE = 1000
 
+# Metrics backend for provider and REST API client, dotted path or None to disable:
+# payments_paymaster.metrics.PrometheusMetrics, StatsdMetrics, LoggingMetrics
+METRICS_BACKEND = None
@@ -1,13 +1,76 @@
 import base64
+import datetime
 import hashlib
+import hmac
+import json
+import re
+import zlib
+
+COMPRESSED_PREFIX = 'zlib:'
+
+
+class Signer(object):
+    """
+    Подпись полей: base64 от хеша строки "prefix" + значения полей через ";" + "suffix".
+    Хеш-функция и хеш неизменного префикса вычисляются один раз при создании,
+    на каждую подпись копируется уже засеянный объект hashlib.
+    """
+
+    def __init__(self, hashed_fields=(), prefix='', suffix='', hash_method='md5'):
+        self.hashed_fields = tuple(hashed_fields)
+        self.hash_method = hash_method
+        self._seed = getattr(hashlib, hash_method)(prefix.encode('utf-8'))
+        self._suffix = suffix.encode('utf-8')
+
+    def sign(self, data, hashed_fields=None):
+        if hashed_fields is None:
+            hashed_fields = self.hashed_fields
+        _line = u';'.join([str(data.get(key) or '') for key in hashed_fields])
+        _hash = self._seed.copy()
+        _hash.update(_line.encode('utf-8'))
+        _hash.update(self._suffix)
+        return base64.b64encode(_hash.digest()).decode('utf-8')
+
+    def verify(self, data, signature, hashed_fields=None):
+        """ Сравнение подписи за постоянное время """
+        if not signature:
+            return False
+        return hmac.compare_digest(self.sign(data, hashed_fields).encode('utf-8'),
+                                   str(signature).encode('utf-8'))
 
 
 def calculate_hash(data, hashed_fields, password, hash_method='md5'):
-    _line = u';'.join(map(str, [data.get(key) or '' for key in hashed_fields]))
-    _line += u';{0}'.format(password)
-    _hash = getattr(hashlib, hash_method)(bytes(_line.encode('utf-8')))
-    _hash = base64.b64encode(_hash.digest())
-    return _hash.decode('utf-8')
+    signer = Signer(hashed_fields, suffix=u';{0}'.format(password), hash_method=hash_method)
+    return signer.sign(data)
+
+
+def dump_notification(data, fields=None, compress=False):
+    """
+    Компактный json уведомления: по одному значению на поле, без пробелов.
+    :param fields: сохраняемые поля, None - все
+    :param compress: сжать zlib, результат - base64 с префиксом COMPRESSED_PREFIX
+    """
+    if fields is None:
+        fields = data.keys()
+    payload = {}
+    for key in fields:
+        value = data.get(key)
+        if value is not None:
+            payload[key] = value
+    dumped = json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+    if compress:
+        return COMPRESSED_PREFIX + base64.b64encode(
+            zlib.compress(dumped.encode('utf-8'), 9)).decode('ascii')
+    return dumped
+
+
+def load_notification(value):
+    """ Разбор dump_notification, а также прежнего формата json.dumps(QueryDict) со списками """
+    if not value:
+        return {}
+    if value.startswith(COMPRESSED_PREFIX):
+        value = zlib.decompress(base64.b64decode(value[len(COMPRESSED_PREFIX):])).decode('utf-8')
+    return {k: v[-1] if isinstance(v, list) and v else v for k, v in json.loads(value).items()}
 
 
 DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
@@ -16,9 +79,68 @@ DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
 def format_dt(dt):
     return dt.strftime(DATETIME_FORMAT)
 
+
+# /Date(1450343650000)/ и /Date(1450343650000+0300)/, миллисекунды от эпохи
+MS_DATE_RE = re.compile(r'/Date\((-?\d+)([+-]\d{4})?\)/')
+
+# python 3.7+
+_fromisoformat = getattr(datetime.datetime, 'fromisoformat', None)
+
+
+def parse_ms_date(value):
+    """ Дата в формате /Date(ms)/, None, если формат другой """
+    match = MS_DATE_RE.search(value)
+    if match is None:
+        return None
+    return datetime.datetime.fromtimestamp(int(match.group(1)) / 1000)
+
+
 def parse_datetime(dt_string):
+    """
+    Разбор даты из ответов API: сначала ISO 8601 и /Date(ms)/,
+    dateutil импортируется и вызывается только для остальных форматов
+    """
+    if dt_string.startswith('/Date('):
+        dt = parse_ms_date(dt_string)
+        if dt is not None:
+            return dt
+    if _fromisoformat is not None:
+        try:
+            return _fromisoformat(dt_string)
+        except ValueError:
+            pass
     from dateutil.parser import parse
     return parse(dt_string)
 
 
+def parse_datetimes(items, key):
+    """ Разобрать поле key у всех записей за один проход, пустые значения не трогаются """
+    parse = parse_datetime
+    for item in items:
+        value = item.get(key)
+        if value:
+            item[key] = parse(value)
+    return items
+
+
+def imap_unordered(func, items, max_workers):
+    """
+    Вызвать func для каждого элемента в пуле потоков, не более max_workers одновременно.
+    Задачи ставятся по мере освобождения пула, поэтому items может быть ленивым.
+    :return: генератор пар (item, future) в порядке завершения
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        while True:
+            for item in items:
+                pending[executor.submit(func, item)] = item
+                if len(pending) >= max_workers:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
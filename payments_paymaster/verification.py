@@ -0,0 +1,99 @@
+"""
+Отложенная проверка платежей через API (api_verify_mode='deferred').
+
+Уведомление подтверждается сразу, платеж остается в статусе WAITING с заполненным
+transaction_id, а запрос getPayment выполняется в фоне бэкендом проверки.
+"""
+import logging
+import time
+
+from django.db import connections
+from payments import PaymentStatus, get_payment_model
+from payments.core import provider_factory
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+
+def verify_payment(variant, payment_pk):
+    """
+    Проверить платеж через API провайдера variant
+    :return: True, если проверка больше не нужна
+    """
+    provider = provider_factory(variant)
+    payment = get_payment_model()._default_manager.get(pk=payment_pk)
+    if payment.status != PaymentStatus.WAITING:
+        return True
+    # блокировка берется в apply_api_state после запроса к API
+    return provider.apply_api_state(payment)
+
+
+class BaseVerificationBackend(object):
+    """
+    Бэкенд фоновой проверки. Для Celery и подобных достаточно переопределить enqueue,
+    поставив задачу, которая вызывает verify_payment(variant, payment_pk)
+    и повторяет ее, пока результат False.
+    """
+
+    def __init__(self, max_attempts=settings.VERIFICATION_MAX_ATTEMPTS,
+                 backoff=settings.VERIFICATION_BACKOFF):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+    def enqueue(self, variant, payment_pk):
+        raise NotImplementedError
+
+    def get_delay(self, attempt):
+        return self.backoff * 2 ** (attempt - 1)
+
+    def run(self, variant, payment_pk):
+        """ Проверка с повторами, True - проверка завершена """
+        for attempt in range(self.max_attempts):
+            if attempt:
+                time.sleep(self.get_delay(attempt))
+            try:
+                if verify_payment(variant, payment_pk):
+                    return True
+            except Exception:
+                logger.exception(u'Payment %s verification attempt %s failed',
+                                 payment_pk, attempt + 1)
+        logger.error(u'Payment %s is not verified after %s attempts',
+                     payment_pk, self.max_attempts)
+        return False
+
+
+class SyncVerificationBackend(BaseVerificationBackend):
+    """ Проверка в текущем потоке после коммита, для тестов и отладки """
+
+    def enqueue(self, variant, payment_pk):
+        self.run(variant, payment_pk)
+
+
+class ThreadVerificationBackend(BaseVerificationBackend):
+    """
+    Проверка в пуле потоков процесса. Очередь хранится в памяти: при перезапуске
+    или падении процесса проверки теряются, и платежи остаются в статусе WAITING
+    до запуска команды paymaster_reconcile
+    """
+
+    def __init__(self, workers=settings.VERIFICATION_WORKERS, **kwargs):
+        super(ThreadVerificationBackend, self).__init__(**kwargs)
+        self.workers = workers
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _run_in_thread(self, variant, payment_pk):
+        try:
+            return self.run(variant, payment_pk)
+        finally:
+            connections.close_all()
+
+    def enqueue(self, variant, payment_pk):
+        return self.executor.submit(self._run_in_thread, variant, payment_pk)
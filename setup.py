@@ -55,9 +55,15 @@ setup(
         'six',
         'Django>=1.8,<3.1',
         'django-payments',
+        'requests',
         # 'simple-crypt',
         'python-dateutil',
     ],
+    extras_require={
+        'async': ['httpx'],
+        'prometheus': ['prometheus_client'],
+        'statsd': ['statsd'],
+    },
     zip_safe=False,
     include_package_data=True,
     keywords=['django'],
@@ -0,0 +1,58 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.urls import reverse
+from payments import PaymentStatus
+
+from payments_paymaster import PaymasterProvider
+
+
+class FakePayment(object):
+    """ Платеж без базы данных, чтобы мерить только код провайдера """
+    variant = 'paymaster'
+    currency = 'RUB'
+    total = Decimal('1234.50')
+    description = ''
+    billing_email = 'example@example.com'
+    extra_data = ''
+    message = ''
+    transaction_id = ''
+    captured_amount = Decimal('0.0')
+
+    def __init__(self, status=PaymentStatus.WAITING):
+        self.token = str(uuid.uuid4())
+        self.status = status
+
+    def get_process_url(self):
+        return reverse('process_payment', kwargs={'token': self.token})
+
+    def get_success_url(self):
+        return 'http://example.com/success/'
+
+    def get_failure_url(self):
+        return 'http://example.com/failure/'
+
+    def change_status(self, status, message=''):
+        self.status = status
+        self.message = message
+
+    def save(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture()
+def fake_payment(settings):
+    settings.LIVE_PAYMENT_HOST = 'example.com'
+    return FakePayment()
+
+
+@pytest.fixture()
+def provider():
+    return PaymasterProvider(
+        client_id='merchant',
+        secret='secret',
+        api_login='login',
+        api_password='password',
+        hash_method='sha256',
+    )
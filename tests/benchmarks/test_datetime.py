@@ -0,0 +1,68 @@
+import datetime
+import re
+from unittest import mock
+
+from dateutil.parser import parse
+
+from payments_paymaster.rest_api.client import PaymasterApiClient
+from payments_paymaster.utils import parse_datetime, parse_datetimes, parse_ms_date
+
+START = datetime.datetime(2020, 1, 1)
+ISO_DATES = [(START + datetime.timedelta(minutes=i)).isoformat() for i in range(1000)]
+MS_DATES = ['/Date({0})/'.format(1577836800000 + i * 60000) for i in range(1000)]
+
+
+def payments_response():
+    payments = [{
+        'PaymentID': i,
+        'State': 'COMPLETE',
+        'LastUpdate': ms_date,
+        'LastUpdateTime': iso_date,
+    } for i, (ms_date, iso_date) in enumerate(zip(MS_DATES, ISO_DATES))]
+    response = mock.Mock()
+    response.json.side_effect = lambda: {
+        'Response': {'Overflow': False, 'Payments': [dict(p) for p in payments]}}
+    return response
+
+
+def test_dateutil_parse(benchmark):
+    benchmark(lambda: [parse(value) for value in ISO_DATES])
+
+
+def test_parse_datetime(benchmark):
+    result = benchmark(lambda: [parse_datetime(value) for value in ISO_DATES])
+    assert result == [parse(value) for value in ISO_DATES]
+
+
+def test_parse_datetimes_batch(benchmark):
+    benchmark(lambda: parse_datetimes([{'date': value} for value in ISO_DATES], 'date'))
+
+
+def test_legacy_ms_date(benchmark):
+    def parse_all():
+        return [datetime.datetime.fromtimestamp(
+            float(re.findall(r"/Date\((\d+)\)/", value)[0]) / 1000) for value in MS_DATES]
+
+    benchmark(parse_all)
+
+
+def test_parse_ms_date(benchmark):
+    benchmark(lambda: [parse_ms_date(value) for value in MS_DATES])
+
+
+def test_legacy_parse_payments(benchmark):
+    response = payments_response()
+
+    def parse_payments():
+        payments = response.json()['Response']['Payments']
+        for payment in payments:
+            del payment['LastUpdate']
+            payment['LastUpdateTime'] = parse(payment['LastUpdateTime'])
+        return payments
+
+    benchmark(parse_payments)
+
+
+def test_parse_payments(benchmark):
+    client = PaymasterApiClient('login', 'password')
+    benchmark(client._parse_payments, payments_response())
@@ -0,0 +1,60 @@
+import base64
+import hashlib
+
+from payments_paymaster import settings
+from payments_paymaster.utils import Signer
+
+DATA = {
+    'LMI_CURRENCY': 'RUB',
+    'LMI_MERCHANT_ID': '2902fb4a-d618-4b6b-aade-793b95e10c59',
+    'LMI_PAID_AMOUNT': '6000.00',
+    'LMI_PAID_CURRENCY': 'RUB',
+    'LMI_PAYMENT_AMOUNT': '6000.00',
+    'LMI_PAYMENT_NO': '41034-20151217-e8a416ef',
+    'LMI_PAYMENT_SYSTEM': '3',
+    'LMI_SIM_MODE': '0',
+    'LMI_SYS_PAYMENT_DATE': '2015-12-17T12:14:10',
+    'LMI_SYS_PAYMENT_ID': '40599192',
+}
+PASSWORD = 'YOUR_MOMMY_SECRET'
+
+
+def legacy_calculate_hash(data, hashed_fields, password, hash_method='md5'):
+    _line = u';'.join(map(str, [data.get(key) or '' for key in hashed_fields]))
+    _line += u';{0}'.format(password)
+    _hash = getattr(hashlib, hash_method)(bytes(_line.encode('utf-8')))
+    _hash = base64.b64encode(_hash.digest())
+    return _hash.decode('utf-8')
+
+
+def test_legacy_calculate_hash(benchmark):
+    benchmark(legacy_calculate_hash, DATA, settings.HASH_FIELDS, PASSWORD, 'sha256')
+
+
+def test_signer_sign(benchmark):
+    signer = Signer(settings.HASH_FIELDS, suffix=u';' + PASSWORD, hash_method='sha256')
+    result = benchmark(signer.sign, DATA)
+    assert result == legacy_calculate_hash(DATA, settings.HASH_FIELDS, PASSWORD, 'sha256')
+
+
+def test_signer_verify(benchmark):
+    signer = Signer(settings.HASH_FIELDS, suffix=u';' + PASSWORD, hash_method='sha256')
+    signature = signer.sign(DATA)
+    assert benchmark(signer.verify, DATA, signature)
+
+
+def test_legacy_api_hash(benchmark):
+    fields = ['login', 'password', 'nonce', 'paymentID']
+    data = {'login': 'login', 'password': 'password', 'nonce': 'nonce', 'paymentID': 1}
+
+    def calculate():
+        _line = u';'.join(map(str, [data.get(key) or '' for key in fields]))
+        return base64.b64encode(hashlib.sha1(_line.encode('utf-8')).digest()).decode('utf-8')
+
+    benchmark(calculate)
+
+
+def test_signer_api_hash(benchmark):
+    signer = Signer(prefix=u'login;password;', hash_method='sha1')
+    data = {'nonce': 'nonce', 'paymentID': 1}
+    benchmark(signer.sign, data, ['nonce', 'paymentID'])
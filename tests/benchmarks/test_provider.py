@@ -0,0 +1,103 @@
+from payments import PaymentStatus
+
+from payments_paymaster.rest_api.client import PaymasterApiClient
+from tests.models import Payment
+from tests.test_provider import notification_data
+
+
+def test_get_hidden_fields(benchmark, provider, fake_payment):
+    data = benchmark(provider.get_hidden_fields, fake_payment)
+    assert data['PAYMENT_TOKEN'] == fake_payment.token
+
+
+def test_get_hidden_fields_first_render(benchmark, provider, fake_payment):
+    def setup():
+        fake_payment.__dict__.pop('_paymaster_hidden_fields', None)
+        return (fake_payment,), {}
+
+    data = benchmark.pedantic(provider.get_hidden_fields, setup=setup, rounds=1000)
+    assert data['PAYMENT_TOKEN'] == fake_payment.token
+
+
+def test_verify_hash(benchmark, provider, fake_payment):
+    data = notification_data(provider, fake_payment)
+    assert benchmark(provider.verify_hash, data)
+
+
+def test_process_prerequest(benchmark, rf, provider, fake_payment):
+    url = fake_payment.get_process_url()
+
+    def setup():
+        return (fake_payment, rf.post(url, {'LMI_PREREQUEST': '1'})), {}
+
+    response = benchmark.pedantic(provider.process_data, setup=setup, rounds=1000)
+    assert response.content == b'YES'
+
+
+def test_process_notification(benchmark, rf, provider):
+    # notification locks the payment row, so it is measured with the database
+    payment = Payment.objects.create(variant='paymaster', total='1234.50', currency='RUB')
+    url = payment.get_process_url()
+    data = notification_data(provider, payment)
+
+    def setup():
+        Payment.objects.filter(pk=payment.pk).update(status=PaymentStatus.WAITING)
+        payment.status = PaymentStatus.WAITING
+        return (payment, rf.post(url, data)), {}
+
+    response = benchmark.pedantic(provider.process_data, setup=setup, rounds=1000)
+    assert response.status_code == 200
+    assert payment.status == PaymentStatus.CONFIRMED
+
+
+def test_process_notification_duplicate(benchmark, rf, provider, fake_payment):
+    data = notification_data(provider, fake_payment)
+    fake_payment.status = PaymentStatus.CONFIRMED
+    fake_payment.transaction_id = data['LMI_SYS_PAYMENT_ID']
+    url = fake_payment.get_process_url()
+
+    def setup():
+        return (fake_payment, rf.post(url, data)), {}
+
+    response = benchmark.pedantic(provider.process_data, setup=setup, rounds=1000)
+    assert response.content == b''
+
+
+def test_process_waiting(benchmark, rf, provider, fake_payment):
+    url = fake_payment.get_process_url()
+
+    def process(request):
+        return provider.process_data(fake_payment, request).render()
+
+    def setup():
+        return (rf.get(url),), {}
+
+    response = benchmark.pedantic(process, setup=setup, rounds=1000)
+    assert response.status_code == 200
+
+
+def test_process_status(benchmark, rf, provider, fake_payment):
+    url = fake_payment.get_process_url()
+
+    def setup():
+        return (fake_payment, rf.get(url, {'format': 'json'})), {}
+
+    response = benchmark.pedantic(provider.process_data, setup=setup, rounds=1000)
+    assert response.status_code == 200
+
+
+def test_process_return(benchmark, rf, provider, fake_payment):
+    fake_payment.status = PaymentStatus.CONFIRMED
+    url = fake_payment.get_process_url()
+
+    def setup():
+        return (fake_payment, rf.get(url)), {}
+
+    response = benchmark.pedantic(provider.process_data, setup=setup, rounds=1000)
+    assert response.url == fake_payment.get_success_url()
+
+
+def test_api_auth_params(benchmark):
+    client = PaymasterApiClient('login', 'password')
+    params = benchmark(lambda: client._auth_params({'paymentID': 1}, ['paymentID']))
+    assert params['hash']
@@ -0,0 +1,72 @@
+import gc
+import json
+import tracemalloc
+
+import pytest
+
+from payments_paymaster.rest_api.client import PaymasterApiClient
+from payments_paymaster.rest_api.records import PaymasterPayment
+
+# payments per listPaymentsFilter result, README quotes the 100k measurement
+COUNTS = [10000, 100000]
+
+
+def payments_json(count):
+    return json.dumps([{
+        'PaymentID': i,
+        'SiteInvoiceID': 'invoice-{0}'.format(i),
+        'SiteID': 'merchant',
+        'State': 'COMPLETE',
+        'Amount': 100.5,
+        'CurrencyCode': 'RUB',
+        'PaymentAmount': 100.5,
+        'PaymentCurrencyCode': 'RUB',
+        'IsTestPayment': False,
+        'PaymentSystemID': 3,
+        'Purpose': 'Payment',
+        'UserIdentifier': None,
+        'UserPhoneNumber': None,
+        'LastUpdate': '/Date({0})/'.format(1577836800000 + i * 1000),
+        'LastUpdateTime': '2020-01-01T00:00:00',
+    } for i in range(count)])
+
+
+def load_dicts(raw):
+    client = PaymasterApiClient('login', 'password')
+    return client._prepare_payments(json.loads(raw))
+
+
+def load_records(raw):
+    return [PaymasterPayment.from_api(p) for p in json.loads(raw)]
+
+
+def retained_memory(load, raw, count):
+    """ Память, занятая результатом load(raw), байт """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = load(raw)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert len(result) == count
+    return size
+
+
+@pytest.mark.parametrize('count', COUNTS)
+def test_records_memory(count):
+    raw = payments_json(count)
+    dicts = retained_memory(load_dicts, raw, count)
+    records = retained_memory(load_records, raw, count)
+    assert records < dicts * 0.6
+
+
+@pytest.mark.parametrize('count', COUNTS)
+def test_load_dicts(benchmark, count):
+    benchmark(load_dicts, payments_json(count))
+
+
+@pytest.mark.parametrize('count', COUNTS)
+def test_load_records(benchmark, count):
+    benchmark(load_records, payments_json(count))
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.auth',
     'django.contrib.admin',
     'payments',
+    'payments_paymaster',
     'tests',
 ]
 
@@ -0,0 +1,150 @@
+import datetime
+import io
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from payments import PaymentStatus
+from payments.signals import status_changed
+
+from payments_paymaster.models import PaymasterPaymentMirror
+from payments_paymaster.provider import PaymasterProvider
+from payments_paymaster.rest_api.fake_server import FakePaymasterServer, serve
+from tests.models import Payment
+
+
+def test_callback_loadtest_command(settings):
+    settings.PAYMENT_VARIANTS = dict(settings.PAYMENT_VARIANTS, paymaster_loadtest=(
+        'payments_paymaster.provider.PaymasterProvider',
+        {'client_id': 'merchant', 'secret': 'secret', 'api_login': 'login',
+         'api_password': 'password', 'hash_method': 'sha256'}))
+    out = io.StringIO()
+    call_command('paymaster_callback_loadtest', variant='paymaster_loadtest', payments=5,
+                 duplicates=2, concurrency=1, keep=True, stdout=out)
+
+    output = out.getvalue()
+    assert 'requests: 10' in output
+    assert 'duplicate 200: 5' in output
+    assert 'redirect: 5' in output
+    assert set(Payment.objects.values_list('status', flat=True)) == {PaymentStatus.CONFIRMED}
+
+
+def test_reconcile_command():
+    payments = [
+        Payment.objects.create(variant='paymaster', total='100.00', currency='RUB',
+                               status=PaymentStatus.WAITING)
+        for _ in range(4)
+    ]
+    confirmed = Payment.objects.create(variant='paymaster', total='100.00', currency='RUB',
+                                       status=PaymentStatus.CONFIRMED, transaction_id='10')
+
+    server = FakePaymasterServer('login', 'password', merchant_id='merchant')
+    updated = datetime.datetime(2020, 1, 2)
+    server.add_payment(1, invoice_id=payments[0].token, amount='99.00', updated=updated)
+    server.add_payment(2, invoice_id=payments[1].token, state='CANCELLED', updated=updated)
+    server.add_payment(3, invoice_id=payments[2].token, state='PROCESSING', updated=updated)
+    server.add_payment(10, invoice_id=confirmed.token, state='CANCELLED', updated=updated)
+    server.add_payment(11, invoice_id='unknown', updated=updated)
+
+    handler = mock.Mock()
+    status_changed.connect(handler)
+    out = io.StringIO()
+    try:
+        with serve(server) as endpoint:
+            provider = PaymasterProvider(client_id='merchant', secret='secret',
+                                         api_login='login', api_password='password',
+                                         api_endpoint=endpoint)
+            with mock.patch('payments_paymaster.management.commands.paymaster_reconcile'
+                            '.provider_factory', return_value=provider):
+                call_command('paymaster_reconcile', period_from='2020-01-01',
+                             period_to='2020-01-03', batch_size=2, stdout=out)
+    finally:
+        status_changed.disconnect(handler)
+
+    assert 'fetched: 5, matched: 2, confirmed: 1, rejected: 1' in out.getvalue()
+    assert handler.call_count == 2
+    statuses = {p.pk: p for p in Payment.objects.all()}
+    assert statuses[payments[0].pk].status == PaymentStatus.CONFIRMED
+    assert statuses[payments[0].pk].transaction_id == '1'
+    assert str(statuses[payments[0].pk].captured_amount) == '99.00'
+    assert statuses[payments[1].pk].status == PaymentStatus.REJECTED
+    assert statuses[payments[2].pk].status == PaymentStatus.WAITING
+    assert statuses[payments[3].pk].status == PaymentStatus.WAITING
+    assert statuses[confirmed.pk].status == PaymentStatus.CONFIRMED
+
+
+def test_reconcile_command_payment_attempts():
+    paid_later, paid_first = [
+        Payment.objects.create(variant='paymaster', total='100.00', currency='RUB',
+                               status=PaymentStatus.WAITING, message='waiting')
+        for _ in range(2)
+    ]
+    server = FakePaymasterServer('login', 'password', merchant_id='merchant')
+    updated = datetime.datetime(2020, 1, 2)
+    # cancelled attempt before the completed one and after it
+    server.add_payment(1, invoice_id=paid_later.token, state='CANCELLED', updated=updated)
+    server.add_payment(2, invoice_id=paid_later.token, updated=updated + datetime.timedelta(1))
+    server.add_payment(3, invoice_id=paid_first.token, updated=updated)
+    server.add_payment(4, invoice_id=paid_first.token, state='CANCELLED',
+                       updated=updated + datetime.timedelta(1))
+
+    out = io.StringIO()
+    with serve(server) as endpoint:
+        provider = PaymasterProvider(client_id='merchant', secret='secret',
+                                     api_login='login', api_password='password',
+                                     api_endpoint=endpoint)
+        with mock.patch('payments_paymaster.management.commands.paymaster_reconcile'
+                        '.provider_factory', return_value=provider):
+            with CaptureQueriesContext(connection) as queries:
+                call_command('paymaster_reconcile', period_from='2020-01-01',
+                             period_to='2020-01-04', batch_size=1, stdout=out)
+
+    assert 'fetched: 4, matched: 2, confirmed: 2, rejected: 0' in out.getvalue()
+    # one UPDATE per matched payment
+    assert len([q for q in queries if q['sql'].startswith('UPDATE')]) == 2
+    paid_later.refresh_from_db()
+    paid_first.refresh_from_db()
+    assert paid_later.status == PaymentStatus.CONFIRMED
+    assert paid_later.transaction_id == '2'
+    assert paid_later.message == ''
+    assert paid_first.status == PaymentStatus.CONFIRMED
+    assert paid_first.transaction_id == '3'
+
+
+def test_sync_payments_command():
+    server = FakePaymasterServer('login', 'password', merchant_id='merchant')
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    server.populate(10, start=now - datetime.timedelta(days=10), days=9)
+
+    out = io.StringIO()
+    with serve(server) as endpoint:
+        provider = PaymasterProvider(client_id='merchant', secret='secret',
+                                     api_login='login', api_password='password',
+                                     api_endpoint=endpoint)
+        with mock.patch('payments_paymaster.management.commands.paymaster_sync_payments'
+                        '.provider_factory', return_value=provider):
+            call_command('paymaster_sync_payments', batch_size=3, stdout=out)
+            assert 'fetched: 10, created: 10, updated: 0' in out.getvalue()
+
+            server.payments[10]['State'] = 'CANCELLED'
+            out = io.StringIO()
+            with mock.patch.object(provider.api_client, 'get_payments',
+                                   wraps=provider.api_client.get_payments) as get_payments:
+                call_command('paymaster_sync_payments', stdout=out)
+            # only the days since the last change are requested again
+            period_from = get_payments.call_args[1]['period_from']
+            assert period_from >= (now - datetime.timedelta(days=2)).date()
+            assert 'created: 0, updated: 1' in out.getvalue()
+
+    assert PaymasterPaymentMirror.objects.count() == 10
+    mirror = PaymasterPaymentMirror.objects.get(payment_id=10)
+    assert mirror.state == 'CANCELLED'
+    assert mirror.site_invoice_id == 'invoice-10'
+    # SiteID of the API is not the siteAlias the sync point is kept for
+    assert mirror.site_id == '1001'
+    assert mirror.site_alias == 'merchant'
+    assert str(mirror.amount) == '100.00'
+    # API times are UTC whatever TIME_ZONE is
+    assert mirror.last_update_time == datetime.datetime.fromisoformat(
+        server.payments[10]['LastUpdateTime']).replace(tzinfo=datetime.timezone.utc)
@@ -0,0 +1,93 @@
+import datetime
+import io
+
+import pytest
+from django.core.management import call_command
+
+from payments_paymaster.rest_api.client import PaymasterApiClient
+from payments_paymaster.rest_api.exceptions import PaymentNotFound, SignError
+from payments_paymaster.rest_api.fake_server import FakePaymasterServer, serve
+from payments_paymaster.rest_api.records import PaymasterDocument, PaymasterPayment
+
+
+@pytest.fixture()
+def server():
+    server = FakePaymasterServer('login', 'password', list_limit=10)
+    server.populate(50, start=datetime.datetime(2020, 1, 1), days=10)
+    server.add_document(1, b'document content', file_name='report.xls',
+                        created=datetime.datetime(2020, 1, 1))
+    return server
+
+
+@pytest.fixture()
+def client(server):
+    with serve(server) as endpoint:
+        yield PaymasterApiClient('login', 'password', endpoint=endpoint)
+
+
+def test_payments(client):
+    assert client.get_payment(1)['SiteInvoiceID'] == 'invoice-1'
+    assert client.get_payment_by_invoice_id('invoice-2', 'merchant')['PaymentID'] == 2
+    with pytest.raises(PaymentNotFound):
+        client.get_payment(100)
+
+    assert client.get_payments(datetime.date(2020, 1, 1), datetime.date(2020, 1, 11))['Overflow']
+    payments = client.iter_payments(datetime.date(2020, 1, 1), datetime.date(2020, 1, 11),
+                                    max_concurrency=4)
+    assert sorted(p['PaymentID'] for p in payments) == list(range(1, 51))
+
+
+def test_records(server, tmp_path):
+    with serve(server) as endpoint:
+        client = PaymasterApiClient('login', 'password', endpoint=endpoint, records=True)
+        payment = client.get_payment(1)
+        payments = list(client.iter_payments(datetime.date(2020, 1, 1),
+                                             datetime.date(2020, 1, 11)))
+        documents = client.documents()
+        refund = client.refund_payment(2, '10.50')
+        fetched = list(client.fetch_documents(documents, str(tmp_path)))
+
+    assert isinstance(payment, PaymasterPayment)
+    assert payment.site_invoice_id == payment['SiteInvoiceID'] == 'invoice-1'
+    assert isinstance(payment.last_update_time, datetime.datetime)
+    assert len(payments) == 50
+    assert isinstance(documents[0], PaymasterDocument)
+    assert documents[0].created == datetime.datetime.fromtimestamp(
+        datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+    assert str(refund.amount) == '10.5'
+    assert fetched[0][1] == str(tmp_path / '1-report.xls')
+
+
+def test_confirm_cancel_refund(client):
+    assert client.cancel_payment(1)['State'] == 'CANCELLED'
+    assert client.confirm_payment(1)['State'] == 'COMPLETE'
+
+    refund = client.refund_payment(1, '10.00', external_id='refund-1')
+    assert refund['Status'] == 'SUCCESS'
+    refunds = list(client.list_refunds(payment_id=1)['Refunds'])
+    assert [r['ExternalID'] for r in refunds] == ['refund-1']
+
+
+def test_documents(client, tmp_path):
+    documents = client.documents()
+    assert documents[0]['Created'] == datetime.datetime.fromtimestamp(1577836800)
+
+    path = str(tmp_path / 'report.xls')
+    client.fetch_document(1, destination=path)
+    with open(path, 'rb') as f:
+        assert f.read() == b'document content'
+
+
+def test_sign_error(server):
+    with serve(server) as endpoint:
+        client = PaymasterApiClient('login', 'wrong', endpoint=endpoint)
+        with pytest.raises(SignError):
+            client.get_payment(1)
+
+
+def test_api_loadtest_command():
+    out = io.StringIO()
+    call_command('paymaster_api_loadtest', requests=50, concurrency=5, payments=10, stdout=out)
+
+    assert 'requests: 50' in out.getvalue()
+    assert 'dict: 50' in out.getvalue()
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# own modules only, django and django-payments are not counted; microseconds
+IMPORT_BUDGET = 50000
+
+
+def import_times(module):
+    """ Время импорта модулей по python -X importtime: {имя: (собственное, суммарное)} """
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='tests.settings.test')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=ROOT, env=env, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_time), int(cumulative))
+    return times
+
+
+def test_lazy_imports():
+    times = import_times('payments_paymaster')
+
+    assert 'payments_paymaster.provider' in times
+    for module in ['requests', 'dateutil', 'httpx', 'payments_paymaster.rest_api',
+                   'payments_paymaster.rest_api.client']:
+        assert module not in times
+
+
+def test_import_time_budget():
+    times = import_times('payments_paymaster')
+
+    own = sum(self_time for name, (self_time, _) in times.items()
+              if name.startswith('payments_paymaster'))
+    assert own < IMPORT_BUDGET
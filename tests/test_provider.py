@@ -0,0 +1,365 @@
+import json
+from unittest import mock
+
+import pytest
+from django.db import transaction
+from payments import PaymentStatus
+
+from payments_paymaster import PaymasterProvider
+from payments_paymaster.metrics import BaseMetrics, PrometheusMetrics, StatsdMetrics
+from payments_paymaster.models import PaymasterNotification
+from payments_paymaster.rest_api.client import PaymasterApiClient
+from payments_paymaster.rest_api.exceptions import PaymentNotFound
+from payments_paymaster.settings import COMPACT_NOTIFICATION_FIELDS
+from payments_paymaster.utils import calculate_hash, dump_notification, load_notification
+from payments_paymaster.verification import ThreadVerificationBackend
+from tests.models import Payment
+
+
+@pytest.fixture()
+def payment():
+    return Payment.objects.create(
+        variant='paymaster',
+        total='1234.50',
+        currency='RUB',
+    )
+
+
+@pytest.fixture()
+def provider():
+    return PaymasterProvider(
+        client_id='merchant',
+        secret='secret',
+        api_login='login',
+        api_password='password',
+    )
+
+
+def notification_data(provider, payment, **extra):
+    data = {
+        'LMI_MERCHANT_ID': provider.client_id,
+        'LMI_PAYMENT_NO': provider.get_payment_number(payment),
+        'LMI_SYS_PAYMENT_ID': '40599192',
+        'LMI_SYS_PAYMENT_DATE': '2015-12-17T12:14:10',
+        'LMI_PAYMENT_AMOUNT': str(payment.total),
+        'LMI_CURRENCY': payment.currency,
+        'LMI_PAID_AMOUNT': str(payment.total),
+        'LMI_PAID_CURRENCY': payment.currency,
+        'LMI_PAYMENT_SYSTEM': '3',
+        'LMI_SIM_MODE': '0',
+        'PAYMENT_TOKEN': payment.token,
+    }
+    data.update(extra)
+    data['LMI_HASH'] = calculate_hash(data,
+                                      hashed_fields=provider.hash_fields,
+                                      password=provider.secret,
+                                      hash_method=provider.hash_method)
+    return data
+
+
+def test_hidden_fields_memoized(settings, provider, payment):
+    settings.LIVE_PAYMENT_HOST = 'example.com'
+    hidden_data = provider.get_hidden_fields(payment)
+
+    assert provider.get_hidden_fields(payment) == hidden_data
+    assert provider.get_hidden_fields(payment) is not hidden_data
+    payment.total = '100.00'
+    assert provider.get_hidden_fields(payment)['LMI_PAYMENT_AMOUNT'] == '100.00'
+
+
+def test_notification(rf, provider, payment):
+    request = rf.post(payment.get_process_url(), notification_data(provider, payment))
+    response = provider.process_data(payment, request)
+
+    assert response.status_code == 200
+    assert payment.status == PaymentStatus.CONFIRMED
+    assert 'api_client' not in provider.__dict__
+
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.CONFIRMED
+    assert payment.transaction_id == '40599192'
+    assert payment.captured_amount == payment.total
+    assert json.loads(payment.extra_data)['LMI_SYS_PAYMENT_ID'] == '40599192'
+
+
+def test_notification_duplicate(rf, provider, payment):
+    data = notification_data(provider, payment)
+    provider.process_data(payment, rf.post(payment.get_process_url(), data))
+
+    stale = Payment.objects.get(pk=payment.pk)
+    stale.status = PaymentStatus.WAITING
+    with mock.patch.object(Payment, 'change_status') as change_status:
+        response = provider.process_data(stale, rf.post(stale.get_process_url(), data))
+        assert response.status_code == 200
+        assert response.content == b''
+        assert stale.status == PaymentStatus.CONFIRMED
+
+        response = provider.process_data(payment, rf.post(payment.get_process_url(), data))
+        assert response.content == b''
+    change_status.assert_not_called()
+
+
+@pytest.mark.parametrize('mode', ['sync', 'deferred'])
+def test_notification_duplicate_waiting(rf, payment, mode):
+    backend = mock.Mock()
+    provider = PaymasterProvider(client_id='merchant', secret='secret', api_login='login',
+                                 api_password='password', api_verify=True,
+                                 api_verify_mode=mode, verification_backend=backend)
+    data = notification_data(provider, payment)
+
+    with mock.patch.object(PaymasterApiClient, 'get_payment',
+                           return_value={'State': 'PROCESSING'}) as get_payment, \
+            mock.patch.object(provider, 'store_notification',
+                              wraps=provider.store_notification) as store_notification:
+        for _ in range(3):
+            stale = Payment.objects.get(pk=payment.pk)
+            response = provider.process_data(stale, rf.post(stale.get_process_url(), data))
+            assert response.status_code == 200
+
+    # the notification is recorded and verified once, the payment still waits
+    assert store_notification.call_count == 1
+    if mode == 'sync':
+        assert get_payment.call_count == 1
+    else:
+        assert get_payment.call_count == 0
+        backend.enqueue.assert_called_once_with('paymaster', payment.pk)
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.WAITING
+    assert payment.transaction_id == '40599192'
+
+
+def test_notification_hash_error(rf, provider, payment):
+    data = notification_data(provider, payment)
+    data['LMI_PAID_AMOUNT'] = '1.00'
+    response = provider.process_data(payment, rf.post(payment.get_process_url(), data))
+
+    assert response.content == b'HashError'
+    assert payment.status == PaymentStatus.WAITING
+
+
+def test_notification_api_verify(rf, payment):
+    provider = PaymasterProvider(
+        client_id='merchant',
+        secret='secret',
+        api_login='login',
+        api_password='password',
+        api_verify=True,
+    )
+    assert provider.api_client is provider.api_client
+
+    with mock.patch.object(PaymasterApiClient, 'get_payment',
+                           return_value={'State': 'COMPLETE'}) as get_payment:
+        request = rf.post(payment.get_process_url(), notification_data(provider, payment))
+        provider.process_data(payment, request)
+
+    get_payment.assert_called_once_with('40599192')
+    assert payment.status == PaymentStatus.CONFIRMED
+
+
+def test_api_verify_without_lock(rf, payment):
+    provider = PaymasterProvider(client_id='merchant', secret='secret', api_login='login',
+                                 api_password='password', api_verify=True)
+    calls = []
+    lock_payment = provider._lock_payment
+
+    def lock(payment):
+        calls.append('lock')
+        return lock_payment(payment)
+
+    def get_payment(payment_id):
+        calls.append('api')
+        return {'State': 'COMPLETE'}
+
+    with mock.patch.object(provider, '_lock_payment', side_effect=lock), \
+            mock.patch.object(PaymasterApiClient, 'get_payment', side_effect=get_payment):
+        request = rf.post(payment.get_process_url(), notification_data(provider, payment))
+        provider.process_data(payment, request)
+        # the API is called between the notification and the status update locks
+        assert calls == ['lock', 'api', 'lock']
+        assert payment.status == PaymentStatus.CONFIRMED
+
+        # confirmed by another request during the API call
+        calls[:] = []
+        payment.status = PaymentStatus.WAITING
+        assert provider.apply_api_state(payment)
+        assert calls == ['api', 'lock']
+        assert payment.status == PaymentStatus.CONFIRMED
+
+
+def test_waiting_poll_page(rf, provider, payment):
+    url = payment.get_process_url()
+    response = provider.process_data(payment, rf.get(url))
+    response.render()
+
+    assert response.status_code == 200
+    assert response['Cache-Control'] == 'no-store'
+    assert response.context_data['status_url'] == url + '?format=json'
+
+
+def test_waiting_refresh(rf, payment):
+    provider = PaymasterProvider(
+        client_id='merchant',
+        secret='secret',
+        api_login='login',
+        api_password='password',
+        waiting_mode='refresh',
+        waiting_poll_interval=5,
+    )
+    url = payment.get_process_url()
+    response = provider.process_data(payment, rf.get(url))
+
+    assert response.status_code == 200
+    assert response['Refresh'] == '5; url={0}'.format(url)
+
+
+def test_status_json(rf, provider, payment):
+    request = rf.get(payment.get_process_url(), {'format': 'json'})
+
+    response = provider.process_data(payment, request)
+    assert json.loads(response.content) == {'status': PaymentStatus.WAITING, 'waiting': True}
+
+    payment.change_status(PaymentStatus.CONFIRMED)
+    response = provider.process_data(payment, request)
+    assert json.loads(response.content) == {'status': PaymentStatus.CONFIRMED, 'waiting': False}
+
+
+def test_return_after_confirm(rf, provider, payment):
+    payment.change_status(PaymentStatus.CONFIRMED)
+    response = provider.process_data(payment, rf.get(payment.get_process_url()))
+
+    assert response.status_code == 302
+    assert response.url == payment.get_success_url()
+
+
+def test_notification_deferred_verify(rf, payment):
+    backend = ThreadVerificationBackend(max_attempts=3, backoff=0)
+    provider = PaymasterProvider(
+        client_id='merchant',
+        secret='secret',
+        api_login='login',
+        api_password='password',
+        api_verify=True,
+        api_verify_mode='deferred',
+        verification_backend=backend,
+    )
+    states = [PaymentNotFound, {'State': 'PROCESSING'}, {'State': 'COMPLETE'}]
+
+    with mock.patch('payments_paymaster.verification.provider_factory', return_value=provider), \
+            mock.patch.object(PaymasterApiClient, 'get_payment',
+                              side_effect=states) as get_payment:
+        request = rf.post(payment.get_process_url(), notification_data(provider, payment))
+        with transaction.atomic():
+            response = provider.process_data(payment, request)
+            assert get_payment.call_count == 0
+
+        assert response.status_code == 200
+        backend.executor.shutdown(wait=True)
+
+    assert get_payment.call_count == 3
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.CONFIRMED
+
+
+class RecordingMetrics(BaseMetrics):
+    def __init__(self):
+        self.timings = []
+        self.counters = []
+
+    def timing(self, name, seconds, **tags):
+        self.timings.append((name, tags))
+
+    def increment(self, name, value=1, **tags):
+        self.counters.append((name, tags))
+
+
+def test_metrics(rf, payment):
+    metrics = RecordingMetrics()
+    provider = PaymasterProvider(client_id='merchant', secret='secret', api_login='login',
+                                 api_password='password', metrics=metrics)
+
+    provider.process_data(payment, rf.post(payment.get_process_url(), {'LMI_PREREQUEST': '1'}))
+    provider.process_data(payment, rf.post(payment.get_process_url(),
+                                           {'LMI_HASH': 'broken'}))
+    provider.process_data(payment, rf.post(payment.get_process_url(),
+                                           notification_data(provider, payment)))
+    provider.process_data(payment, rf.get(payment.get_process_url()))
+
+    assert metrics.counters == [('hash_check', {'outcome': 'fail'}),
+                                ('hash_check', {'outcome': 'ok'})]
+    assert metrics.timings == [
+        ('status_change', {'status': PaymentStatus.WAITING}),
+        ('process_data', {'branch': 'prerequest'}),
+        ('process_data', {'branch': 'hash_error'}),
+        ('status_change', {'status': PaymentStatus.CONFIRMED}),
+        ('process_data', {'branch': 'notification'}),
+        ('process_data', {'branch': 'redirect'}),
+    ]
+
+    metrics.timings = []
+    with mock.patch.object(provider.api_client, 'session') as session:
+        session.get.return_value.headers = {'Content-Type': 'application/json'}
+        session.get.return_value.json.return_value = {'ErrorCode': -13}
+        with pytest.raises(PaymentNotFound):
+            provider.api_client.get_payment(1)
+    assert metrics.timings == [
+        ('api_request', {'endpoint': 'getPayment', 'outcome': 'PaymentNotFound'})]
+
+
+def test_statsd_metrics():
+    client = mock.Mock()
+    metrics = StatsdMetrics(client)
+    metrics.timing('api_request', 0.5, endpoint='getPayment', outcome='ok')
+    metrics.increment('hash_check', outcome='fail')
+
+    client.timing.assert_called_once_with('api_request.getPayment.ok', 500)
+    client.incr.assert_called_once_with('hash_check.fail', 1)
+
+
+def test_prometheus_metrics_instances():
+    prometheus_client = pytest.importorskip('prometheus_client')
+    registry = prometheus_client.CollectorRegistry()
+    first = PrometheusMetrics(registry)
+    second = PrometheusMetrics(registry)
+
+    first.timing('api_request', 0.5, endpoint='getPayment', outcome='ok')
+    second.timing('api_request', 0.5, endpoint='getPayment', outcome='ok')
+    second.increment('hash_check', outcome='fail')
+
+    assert registry.get_sample_value('paymaster_api_request_seconds_count', {
+        'endpoint': 'getPayment', 'outcome': 'ok'}) == 2
+    assert registry.get_sample_value('paymaster_hash_check_total', {'outcome': 'fail'}) == 1
+
+
+def test_dump_notification(rf, provider, payment):
+    data = rf.post('/', notification_data(provider, payment, EXTRA='x' * 100)).POST
+    legacy = json.dumps(data, indent=2)
+
+    # all fields are kept by default
+    stored = dump_notification(data, provider.notification_fields)
+    assert load_notification(stored) == data.dict()
+
+    compact = dump_notification(data, COMPACT_NOTIFICATION_FIELDS)
+    assert 'EXTRA' not in compact
+    assert len(compact) < len(legacy) * 2 / 3
+    assert load_notification(compact) == {k: data[k] for k in load_notification(compact)}
+
+    compressed = dump_notification(data, compress=True)
+    assert load_notification(compressed) == data.dict()
+    assert load_notification(legacy) == data.dict()
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_notification_model_storage(rf, payment, compress):
+    provider = PaymasterProvider(client_id='merchant', secret='secret', api_login='login',
+                                 api_password='password', notification_storage='model',
+                                 notification_compress=compress)
+    data = notification_data(provider, payment)
+    provider.process_data(payment, rf.post(payment.get_process_url(), data))
+
+    payment.refresh_from_db()
+    assert payment.status == PaymentStatus.CONFIRMED
+    assert payment.extra_data == ''
+    notification = PaymasterNotification.objects.get()
+    assert notification.payment_id == str(payment.pk)
+    assert notification.transaction_id == '40599192'
+    assert provider.get_notification(payment)['LMI_HASH'] == data['LMI_HASH']
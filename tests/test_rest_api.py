@@ -0,0 +1,479 @@
+import asyncio
+import base64
+import datetime
+import hashlib
+import pickle
+from decimal import Decimal
+from unittest import mock
+
+import httpx
+import pytest
+import requests
+from django.core.cache import cache as django_cache
+
+from payments_paymaster.rest_api.async_client import AsyncPaymasterApiClient
+from payments_paymaster.rest_api.cache import DjangoPaymentCache, LocMemPaymentCache
+from payments_paymaster.rest_api.client import PaymasterApiClient, get_session
+from payments_paymaster.rest_api.exceptions import (
+    PaymasterNetworkError, PaymasterPermissionError, PaymasterUnavailable, PaymentNotFound,
+    PaymentSystemDisabled, SignError)
+from payments_paymaster.rest_api.records import PaymasterPayment
+from payments_paymaster.rest_api.retry import CircuitBreaker, RetryPolicy
+from payments_paymaster.rest_api.throttling import (
+    AdaptiveConcurrencyLimiter, Throttle, TokenBucket, get_throttle)
+from payments_paymaster.utils import parse_datetime
+
+
+def make_response(payload):
+    response = mock.Mock()
+    response.headers = {'Content-Type': 'application/json; charset=utf-8'}
+    response.json.return_value = payload
+    return response
+
+
+def make_file_response(content):
+    response = mock.MagicMock()
+    response.headers = {'Content-Type': 'application/octet-stream'}
+    response.iter_content.side_effect = lambda chunk_size: (
+        content[i:i + chunk_size] for i in range(0, len(content), chunk_size))
+    return response
+
+
+def test_shared_session():
+    assert get_session() is get_session()
+    assert get_session(pool_size=2) is not get_session()
+    assert PaymasterApiClient('login', 'password').session is get_session()
+
+
+def test_request_uses_session():
+    session = mock.Mock()
+    session.get.return_value = make_response({'ErrorCode': 0})
+    client = PaymasterApiClient('login', 'password', session=session, timeout=5)
+
+    client._get('getPayment', params={'paymentID': 1})
+
+    session.get.assert_called_once_with(
+        'https://paymaster.ru/partners/rest/getPayment',
+        data=None, params={'paymentID': 1}, timeout=5,
+    )
+
+
+def test_auth_params():
+    client = PaymasterApiClient('login', 'password')
+    client._gen_nonce = lambda: 'nonce'
+    params = client._auth_params({'paymentID': 1, 'amount': None}, ['paymentID', 'amount'])
+
+    assert params['login'] == 'login'
+    assert params['nonce'] == 'nonce'
+    assert params['hash'] == base64.b64encode(
+        hashlib.sha1(b'login;password;nonce;1;').digest()).decode('utf-8')
+
+
+def test_get_payment():
+    session = mock.Mock()
+    session.get.return_value = make_response({
+        'ErrorCode': 0,
+        'Payment': {'PaymentID': 1, 'State': 'COMPLETE',
+                    'LastUpdate': '/Date(1450354450000)/',
+                    'LastUpdateTime': '2015-12-17T12:14:10'},
+    })
+    client = PaymasterApiClient('login', 'password', session=session)
+
+    payment = client.get_payment(1)
+
+    assert payment['State'] == PaymasterApiClient.PaymentState.COMPLETE
+    assert payment['LastUpdateTime'] == datetime.datetime(2015, 12, 17, 12, 14, 10)
+    assert session.get.call_args[1]['params']['paymentID'] == 1
+
+
+def test_api_error():
+    session = mock.Mock()
+    session.get.return_value = make_response({'ErrorCode': -13})
+    client = PaymasterApiClient('login', 'password', session=session)
+
+    with pytest.raises(PaymentNotFound):
+        client.get_payment(1)
+
+
+def test_async_get_payment():
+    def handler(request):
+        assert request.url.path == '/partners/rest/getPaymentByInvoiceID'
+        assert request.url.params['invoiceID'] == 'invoice'
+        assert request.url.params['hash']
+        return httpx.Response(200, json={
+            'ErrorCode': 0,
+            'Payment': {'PaymentID': 1, 'State': 'COMPLETE',
+                        'LastUpdate': None, 'LastUpdateTime': None},
+        })
+
+    async def run():
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        async with http_client:
+            client = AsyncPaymasterApiClient('login', 'password', http_client=http_client)
+            return await client.get_payment_by_invoice_id('invoice', 'merchant')
+
+    payment = asyncio.run(run())
+    assert payment['State'] == 'COMPLETE'
+
+
+def test_async_api_error():
+    def handler(request):
+        return httpx.Response(200, json={'ErrorCode': -7})
+
+    async def run():
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        async with http_client:
+            client = AsyncPaymasterApiClient('login', 'password', http_client=http_client)
+            await client.get_payment(1)
+
+    with pytest.raises(SignError):
+        asyncio.run(run())
+
+
+def test_get_payments_bulk():
+    def get(url, params, **kwargs):
+        if params['paymentID'] == 2:
+            return make_response({'ErrorCode': -13})
+        return make_response({
+            'ErrorCode': 0,
+            'Payment': {'PaymentID': params['paymentID'], 'State': 'COMPLETE',
+                        'LastUpdate': None, 'LastUpdateTime': None},
+        })
+
+    session = mock.Mock()
+    session.get.side_effect = get
+    client = PaymasterApiClient('login', 'password', session=session)
+
+    result = dict(client.get_payments_bulk(range(1, 11), max_concurrency=3))
+
+    assert sorted(result) == list(range(1, 11))
+    assert isinstance(result[2], PaymentNotFound)
+    assert result[5]['PaymentID'] == 5
+
+
+def test_async_get_payments_bulk():
+    def handler(request):
+        payment_id = int(request.url.params['paymentID'])
+        if payment_id == 2:
+            return httpx.Response(200, json={'ErrorCode': -13})
+        return httpx.Response(200, json={
+            'ErrorCode': 0,
+            'Payment': {'PaymentID': payment_id, 'State': 'COMPLETE',
+                        'LastUpdate': None, 'LastUpdateTime': None},
+        })
+
+    async def run():
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        async with http_client:
+            client = AsyncPaymasterApiClient('login', 'password', http_client=http_client)
+            return {_id: payment async for _id, payment
+                    in client.get_payments_bulk(range(1, 6), max_concurrency=2)}
+
+    result = asyncio.run(run())
+    assert sorted(result) == [1, 2, 3, 4, 5]
+    assert isinstance(result[2], PaymentNotFound)
+    assert result[3]['PaymentID'] == 3
+
+
+def list_response(items_key, items, params, limit=6):
+    period_from = datetime.date.fromisoformat(params['periodFrom'])
+    period_to = datetime.date.fromisoformat(params['periodTo'])
+    found = [item for item in items if period_from <= item['date'] <= period_to]
+    return make_response({
+        'ErrorCode': 0,
+        'Response': {
+            'Overflow': len(found) > limit,
+            items_key: [dict(item) for item in found[:limit]],
+        }
+    })
+
+
+@pytest.mark.parametrize('max_concurrency', [1, 4])
+def test_iter_payments(max_concurrency):
+    start = datetime.date(2020, 1, 1)
+    payments = [
+        {'PaymentID': i, 'date': start + datetime.timedelta(days=i // 3),
+         'LastUpdate': None, 'LastUpdateTime': None}
+        for i in range(30)
+    ]
+    session = mock.Mock()
+    session.get.side_effect = lambda url, params, **kwargs: list_response(
+        'Payments', payments, params)
+    client = PaymasterApiClient('login', 'password', session=session)
+
+    result = client.iter_payments(start, start + datetime.timedelta(days=10),
+                                  max_concurrency=max_concurrency)
+
+    assert sorted(p['PaymentID'] for p in result) == list(range(30))
+
+
+def test_iter_payments_without_overflow():
+    start = datetime.date(2020, 1, 1)
+    payments = [{'PaymentID': i, 'date': start + datetime.timedelta(days=i),
+                 'LastUpdate': None, 'LastUpdateTime': None} for i in range(5)]
+    session = mock.Mock()
+    session.get.side_effect = lambda url, params, **kwargs: list_response(
+        'Payments', payments, params)
+    client = PaymasterApiClient('login', 'password', session=session)
+
+    result = list(client.iter_payments(start, start + datetime.timedelta(days=10)))
+
+    # the period is split only when the API reports Overflow
+    assert len(result) == 5
+    assert session.get.call_count == 1
+
+
+def test_iter_refunds():
+    start = datetime.date(2020, 1, 1)
+    refunds = [
+        {'PaymentID': i, 'ExternalID': None, 'Amount': 10, 'Status': 'SUCCESS',
+         'date': start + datetime.timedelta(days=i // 3), 'LastUpdate': None}
+        for i in range(30)
+    ]
+    session = mock.Mock()
+    session.get.side_effect = lambda url, params, **kwargs: list_response(
+        'Refunds', refunds, params)
+    client = PaymasterApiClient('login', 'password', session=session)
+
+    result = client.iter_refunds(start, start + datetime.timedelta(days=10),
+                                 chunk_days=4, max_concurrency=3)
+
+    assert sorted(r['PaymentID'] for r in result) == list(range(30))
+
+
+def test_fetch_document_stream(tmp_path):
+    session = mock.Mock()
+    session.get.return_value = make_file_response(b'0123456789')
+    client = PaymasterApiClient('login', 'password', session=session)
+    path = str(tmp_path / 'document.pdf')
+
+    assert client.fetch_document(1, destination=path, chunk_size=3) == path
+
+    assert session.get.call_args[1]['stream'] is True
+    with open(path, 'rb') as f:
+        assert f.read() == b'0123456789'
+
+
+def test_fetch_documents(tmp_path):
+    def get(url, params, **kwargs):
+        if params['documentID'] == 2:
+            return make_response({'ErrorCode': -6})
+        return make_file_response(str(params['documentID']).encode())
+
+    session = mock.Mock()
+    session.get.side_effect = get
+    client = PaymasterApiClient('login', 'password', session=session)
+    documents = [{'DocumentID': i, 'FileName': 'report.xls'} for i in range(1, 4)]
+
+    result = {document['DocumentID']: path for document, path
+              in client.fetch_documents(documents, str(tmp_path), max_concurrency=2)}
+
+    assert isinstance(result[2], PaymasterPermissionError)
+    with open(result[3], 'rb') as f:
+        assert f.read() == b'3'
+    assert result[3] == str(tmp_path / '3-report.xls')
+
+
+def test_non_json_response_is_not_success():
+    # only getDocumentContent may answer with non-json content
+    response = make_file_response(b'<html>Service error</html>')
+    response.headers = {'Content-Type': 'text/html'}
+    response.json.side_effect = ValueError('No JSON object could be decoded')
+    session = mock.Mock()
+    session.get.return_value = response
+    client = PaymasterApiClient('login', 'password', session=session)
+
+    with pytest.raises(ValueError):
+        client.get_payment(1)
+    assert client.fetch_document(1) is response
+
+
+@pytest.mark.parametrize('cache_class', [LocMemPaymentCache, DjangoPaymentCache])
+def test_payment_cache(cache_class):
+    def get(url, params, **kwargs):
+        if url.endswith('ConfirmPayment'):
+            state = 'COMPLETE'
+        else:
+            state = 'PROCESSING' if session.get.call_count == 1 else 'COMPLETE'
+        return make_response({
+            'ErrorCode': 0,
+            'Payment': {'PaymentID': 1, 'State': state,
+                        'LastUpdate': None, 'LastUpdateTime': None},
+        })
+
+    django_cache.clear()
+    session = mock.Mock()
+    session.get.side_effect = get
+    cache = cache_class(ttl=0, final_ttl=60)
+    client = PaymasterApiClient('login', 'password', session=session, cache=cache)
+
+    assert client.get_payment(1)['State'] == 'PROCESSING'
+    # transient state expires at once, final one is cached
+    assert client.get_payment(1)['State'] == 'COMPLETE'
+    assert client.get_payment(1)['State'] == 'COMPLETE'
+    assert client.get_payment_by_invoice_id('invoice', 'merchant')['State'] == 'COMPLETE'
+    assert client.get_payment_by_invoice_id('invoice', 'merchant')['State'] == 'COMPLETE'
+    assert session.get.call_count == 3
+
+    client.confirm_payment(1)
+    client.get_payment(1)
+    assert session.get.call_count == 5
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+    waits = [bucket.reserve() for _ in range(4)]
+
+    assert waits[:2] == [0, 0]
+    assert waits[2] == pytest.approx(0.1, abs=0.01)
+    assert waits[3] == pytest.approx(0.2, abs=0.01)
+
+
+def test_adaptive_concurrency_limiter():
+    limiter = AdaptiveConcurrencyLimiter(max_limit=8)
+    limiter.acquire()
+    limiter.release(overloaded=True)
+    assert limiter.limit == 4
+    limiter.acquire()
+    limiter.release()
+    assert limiter.limit == 4.25
+
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(overloaded=True)
+    assert limiter.limit == 1
+
+
+def test_throttled_client():
+    assert get_throttle() is None
+    assert get_throttle(rate=5) is get_throttle(rate=5)
+
+    throttle = Throttle(max_concurrency=4)
+    session = mock.Mock()
+    session.get.side_effect = [
+        make_response({'ErrorCode': 0, 'Payment': {}}),
+        make_response({'ErrorCode': -2}),
+    ]
+    client = PaymasterApiClient('login', 'password', session=session, throttle=throttle)
+
+    client._get('getPayment')
+    with pytest.raises(PaymasterNetworkError):
+        client._get('getPayment')
+
+    assert throttle.stats['requests'] == 2
+    assert throttle.stats['overloads'] == 1
+    assert throttle.stats['concurrency_limit'] == 2
+    assert throttle.limiter.in_flight == 0
+
+
+def make_http_error(status_code):
+    response = mock.Mock(status_code=status_code)
+    response.raise_for_status.side_effect = requests.HTTPError(response=response)
+    return response
+
+
+def test_retry_transient_errors():
+    session = mock.Mock()
+    session.get.side_effect = [
+        requests.ConnectionError(),
+        make_http_error(503),
+        make_response({'ErrorCode': -5}),
+        make_response({'ErrorCode': 0, 'Payment': {'PaymentID': 1, 'LastUpdate': None,
+                                                   'LastUpdateTime': None}}),
+    ]
+    client = PaymasterApiClient('login', 'password', session=session,
+                                retry=RetryPolicy(retries=3, backoff=0))
+
+    assert client.get_payment(1)['PaymentID'] == 1
+
+    nonces = {call[1]['params']['nonce'] for call in session.get.call_args_list}
+    assert len(nonces) == 4
+    params = session.get.call_args[1]['params']
+    assert params['hash'] == client._signer.sign(params, ['nonce', 'paymentID'])
+
+
+def test_retry_limits():
+    session = mock.Mock()
+    session.get.side_effect = [make_response({'ErrorCode': -13})]
+    client = PaymasterApiClient('login', 'password', session=session,
+                                retry=RetryPolicy(retries=3, backoff=0))
+    with pytest.raises(PaymentNotFound):
+        client.get_payment(1)
+
+    # refund is not repeated when the request could be executed
+    session.get.side_effect = [make_http_error(503)]
+    with pytest.raises(requests.HTTPError):
+        client.refund_payment(1, 10)
+
+    session.get.side_effect = [make_response({'ErrorCode': -24})]
+    with pytest.raises(PaymentSystemDisabled):
+        client.refund_payment(1, 10)
+    assert session.get.call_count == 3
+
+    # only a request that was never sent is repeated
+    session.get.side_effect = [requests.ConnectTimeout(), make_response({
+        'ErrorCode': 0, 'Refund': {'RefundID': 1, 'PaymentID': 1, 'Status': 'SUCCESS'}})]
+    assert client.refund_payment(1, 10)['RefundID'] == 1
+    assert session.get.call_count == 5
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+    session = mock.Mock()
+    session.get.side_effect = requests.ConnectionError()
+    client = PaymasterApiClient('login', 'password', session=session, circuit_breaker=breaker)
+
+    for _ in range(2):
+        with pytest.raises(requests.ConnectionError):
+            client.get_payment(1)
+    with pytest.raises(PaymasterUnavailable):
+        client.get_payment(1)
+    assert session.get.call_count == 2
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.recovery_timeout = 0
+    session.get.side_effect = [make_response({'ErrorCode': -13})]
+    with pytest.raises(PaymentNotFound):
+        client.get_payment(1)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.parametrize('value', [
+    '2015-12-17T12:14:10',
+    '2015-12-17T12:14:10.123',
+    '2015-12-17T12:14:10+03:00',
+    '2015-12-17',
+    '17 Dec 2015 12:14:10',
+])
+def test_parse_datetime(value):
+    from dateutil.parser import parse
+    assert parse_datetime(value) == parse(value)
+
+
+def test_parse_ms_date():
+    expected = datetime.datetime.fromtimestamp(1450343650)
+    assert parse_datetime('/Date(1450343650000)/') == expected
+    assert parse_datetime('/Date(1450343650000+0300)/') == expected
+
+
+def test_payment_record():
+    payment = PaymasterPayment.from_api({
+        'PaymentID': 1, 'State': 'COMPLETE', 'Amount': 10.1, 'PaymentAmount': None,
+        'LastUpdateTime': '2020-01-01T10:00:00', 'Unknown': 'dropped',
+    })
+
+    assert payment._amount == 10.1
+    assert payment.amount == Decimal('10.1')
+    assert payment._amount == Decimal('10.1')
+    assert payment.payment_amount is None
+    assert payment['LastUpdateTime'] == datetime.datetime(2020, 1, 1, 10)
+    assert payment.get('State') == 'COMPLETE'
+    assert payment.get('Unknown') is None
+    with pytest.raises(KeyError):
+        payment['Unknown']
+    with pytest.raises(AttributeError):
+        payment.extra = 1
+
+    assert pickle.loads(pickle.dumps(payment)) == payment
+    assert payment.copy() == payment
+    assert payment.to_dict()['PaymentID'] == 1